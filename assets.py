@@ -0,0 +1,86 @@
+import hashlib
+import os
+import struct
+import time
+import pygame
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ASSET_DIR, ".cache")
+
+# Cached image layout: HEADER, then the raw RGB or RGBA pixels
+HEADER = struct.Struct("!4sHH?")
+MAGIC = b"GSIM"
+
+STARTED = time.perf_counter()
+
+
+class Assets:
+
+    def __init__(self, asset_dir=ASSET_DIR, cache_dir=CACHE_DIR):
+        """
+        Images loaded, scaled and converted to the display format once. The
+        scaled pixels are kept on disk by source hash and size, so the next
+        start reads them back instead of decoding and scaling the PNG again.
+        """
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir
+        self.images = {}
+        self.loads = []  # (name, size, origin, seconds)
+
+    def image(self, name, size=None, alpha=False):
+        """
+        Surface of an image, scaled to size when given. Raises FileNotFoundError
+        (or pygame.error for an unreadable image) like pygame.image.load.
+        """
+        key = (name, size, alpha)
+        surface = self.images.get(key)
+        if surface is None:
+            started = time.perf_counter()
+            surface, origin = self.load(name, size, alpha)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha() if alpha else surface.convert()
+            self.images[key] = surface
+            self.loads.append((name, surface.get_size(), origin, time.perf_counter() - started))
+        return surface
+
+    def load(self, name, size, alpha):
+        path = os.path.join(self.asset_dir, name)
+        if size is None:
+            return pygame.image.load(path), "decoded"
+        with open(path, "rb") as f:
+            source = f.read()
+        digest = hashlib.sha1(source).hexdigest()[:16]
+        cached = os.path.join(self.cache_dir, f"{digest}-{size[0]}x{size[1]}{'-alpha' if alpha else ''}.img")
+        mode = "RGBA" if alpha else "RGB"
+        try:
+            with open(cached, "rb") as f:
+                data = f.read()
+            magic, width, height, has_alpha = HEADER.unpack_from(data)
+            if magic == MAGIC and (width, height) == tuple(size) and has_alpha == alpha:
+                return pygame.image.frombuffer(data[HEADER.size:], (width, height), mode), "cache"
+        except (OSError, struct.error, ValueError):
+            pass
+        surface = pygame.transform.scale(pygame.image.load(path), size)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            partial = f"{cached}.{os.getpid()}.tmp"
+            with open(partial, "wb") as f:
+                f.write(HEADER.pack(MAGIC, size[0], size[1], alpha))
+                f.write(pygame.image.tobytes(surface, mode))
+            os.replace(partial, cached)
+        except OSError as e:
+            print(f"[ASSETS] Could not cache {name}: {e}")
+        return surface, "decoded"
+
+    def report(self):
+        """
+        Print how long each image took and the time since startup
+        """
+        for name, size, origin, seconds in self.loads:
+            print(f"[ASSETS] {name} {size[0]}x{size[1]} ({origin}) in {seconds * 1000:.1f} ms")
+        print(f"[ASSETS] {len(self.loads)} images in {sum(load[3] for load in self.loads) * 1000:.1f} ms, "
+              f"ready {(time.perf_counter() - STARTED) * 1000:.0f} ms after startup")
+
+
+# Shared by every game
+assets = Assets()
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+"""
+Contention benchmark for the relay registry.
+
+Relays datagrams to every registered player while registrar threads keep
+registering and unregistering players, once with the original design (one
+lock held for the whole fan-out) and once with the copy-on-write snapshot.
+"""
+
+import argparse
+import socket
+import time
+from threading import Thread, Lock, Event
+from player import Player
+from registry import PlayerRegistry
+import protocol
+import server
+
+
+class LockedRegistry:
+    """
+    The original design: a plain dict and one lock shared by relay and registration
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.players = {}
+
+    def register(self, player):
+        with self.lock:
+            self.players[player.identifier] = player
+
+    def unregister(self, identifier):
+        with self.lock:
+            return self.players.pop(identifier, None)
+
+    def relay(self, data, addr, sendto):
+        with self.lock:
+            for player in self.players.values():
+                if player.addr != addr:
+                    sendto(data, player.addr)
+
+
+class SnapshotRegistry(PlayerRegistry):
+
+    def relay(self, data, addr, sendto):
+        server.relay(data, addr, self.snapshot, sendto)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(registry, players, registrars, rate, seconds, sink_addr):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    # Every player points at the same sink, nobody reads it: we measure the relay, not delivery
+    for i in range(players):
+        registry.register(Player(f"static:{i}", sink_addr, i + 1, protocol.JSON))
+    # The relay drops datagrams from unregistered addresses
+    registry.register(Player("sender", ("127.0.0.1", 1), 0, protocol.JSON))
+
+    stop = Event()
+    latencies = [[] for _ in range(registrars)]
+
+    def hammer(worker):
+        n = 0
+        while not stop.is_set():
+            identifier = f"churn:{worker}:{n % 16}"
+            t0 = time.perf_counter()
+            registry.register(Player(identifier, sink_addr, 0, protocol.JSON))
+            latencies[worker].append(time.perf_counter() - t0)
+            registry.unregister(identifier)
+            n += 1
+            if rate:
+                time.sleep(1.0 / rate)
+
+    threads = [Thread(target=hammer, args=(w,)) for w in range(registrars)]
+    for t in threads:
+        t.start()
+
+    data = b'{"identifier": "bench", "message": "x"}'
+    relayed = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        registry.relay(data, ("127.0.0.1", 1), sock.sendto)
+        relayed += 1
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    for t in threads:
+        t.join()
+    sock.close()
+    samples = [x for worker in latencies for x in worker]
+    return relayed / elapsed, len(samples) / elapsed, percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registry contention benchmark")
+    parser.add_argument("--players", type=int, default=100, help="Registered players per relay")
+    parser.add_argument("--registrars", type=int, default=4, help="Threads hammering registration")
+    parser.add_argument("--rate", type=float, default=1000,
+                        help="Registrations per second per registrar thread (0: as fast as possible)")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration of each run")
+    args = parser.parse_args()
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sink_addr = sink.getsockname()
+
+    print(f"{args.players} players, {args.registrars} registrar threads, {args.seconds}s per run")
+    for name, registry in (("locked", LockedRegistry()), ("snapshot", SnapshotRegistry())):
+        relays, registrations, p50, p99 = run(
+            registry, args.players, args.registrars, args.rate, args.seconds, sink_addr)
+        print(f"  {name:<9} relays/s: {relays:9.0f}  datagrams/s: {relays * args.players:10.0f}"
+              f"  registrations/s: {registrations:8.0f}"
+              f"  register p50: {p50 * 1e6:8.1f}us  p99: {p99 * 1e6:8.1f}us")
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
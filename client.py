@@ -1,58 +1,381 @@
+import asyncio
 import json
 import threading
 import socket
 import time
+from collections.abc import Sequence
+from reliable import ReliableChannel, POLL
+import protocol
 
+# Inbox overflow policies
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+BLOCK = "block"
 
-class Client:
+
+class Inbox:
+    def __init__(self, capacity=4096, overflow=DROP_OLDEST):
+        """
+        Fixed-capacity ring buffer of raw datagrams
+        """
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown overflow policy {overflow}")
+        self.capacity = capacity
+        self.overflow = overflow
+        self.buffer = [None] * capacity
+        self.head = 0
+        self.size = 0
+        self.queued = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.closed = False
+
+    def put(self, data, timeout=None):
+        """
+        Store a datagram, returns False if it (or the oldest one) was dropped
+        """
+        with self.lock:
+            if self.size == self.capacity:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.overflow == BLOCK:
+                    self.not_full.wait_for(lambda: self.size < self.capacity or self.closed, timeout)
+                    if self.size == self.capacity:
+                        self.dropped += 1
+                        return False
+                else:
+                    self.head = (self.head + 1) % self.capacity
+                    self.size -= 1
+                    self.dropped += 1
+            self.buffer[(self.head + self.size) % self.capacity] = data
+            self.size += 1
+            self.queued += 1
+            return True
+
+    def drain(self):
+        """
+        Take every queued datagram in arrival order
+        """
+        with self.lock:
+            start, end = self.head, self.head + self.size
+            if end <= self.capacity:
+                items = self.buffer[start:end]
+                self.buffer[start:end] = [None] * self.size
+            else:
+                end -= self.capacity
+                items = self.buffer[start:] + self.buffer[:end]
+                self.buffer[start:] = [None] * (self.capacity - start)
+                self.buffer[:end] = [None] * end
+            self.head = 0
+            self.size = 0
+            self.not_full.notify_all()
+        return items
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.not_full.notify_all()
+
+    def stats(self):
+        return {"queued": self.queued, "dropped": self.dropped, "pending": self.size}
+
+    def __len__(self):
+        return self.size
+
+
+class Messages(Sequence):
+    def __init__(self, raw, parse):
+        """
+        Drained datagrams, each one decoded the first time it is accessed
+        """
+        self.raw = raw
+        self.parse = parse
+        self.decoded = [None] * len(raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.raw)))]
+        msg = self.decoded[index]
+        if msg is None:
+            msg = self.decoded[index] = self.parse(self.raw[index])
+        return msg
+
+    def __len__(self):
+        return len(self.raw)
+
+
+class BaseClient:
     def __init__(self,
                  server_host,
                  server_port_tcp=12345,
                  server_port_udp=54321,
-                 client_port_udp=0):  # 0 for dynamic UDP port allocation
+                 wire=protocol.BINARY,
+                 room=protocol.DEFAULT_ROOM):
         """
-        Create a game server client
+        Registration and wire format logic shared by the threaded and asyncio clients
         """
         self.identifier = None
+        self.session = 0
+        self.seq = 0
+        self.wire = wire  # requested format, replaced by the one the server agrees to
+        self.room = room
         self.server_host = server_host
         self.server_port_tcp = server_port_tcp
         self.server_port_udp = server_port_udp
-        self.client_host = socket.gethostbyname(socket.gethostname())
+        self.client_udp = None
+        self.request_id = 0
+        # Idle timeout announced by the server, 0 when it never evicts
+        self.timeout = 0
+        self.last_sent = 0.0
+        # Reliable ordered stream with the server, replaced on every registration
+        self.channel = ReliableChannel()
+        # Room state mirrored from a tick-driven server
+        self.state = {}
+        self.state_tick = 0
+        self.state_lock = threading.Lock()
+
+    def registration_request(self):
+        return {
+            "action": "register",
+            "payload": self.client_udp[1],
+            "protocol": self.wire,
+            "room": self.room
+        }
 
-        # UDP socket for communication
-        self.client_udp = (self.client_host, client_port_udp)
+    def next_request(self, message):
+        self.request_id += 1
+        return dict(message, id=self.request_id)
+
+    def registered(self, data):
+        """
+        Apply the server answer to a registration request
+        """
+        if data["success"]:
+            self.identifier = data["identifier"]
+            # Servers that predate the binary format don't answer with a protocol
+            self.session = data.get("session", 0)
+            self.wire = data.get("protocol", protocol.JSON)
+            self.timeout = data.get("timeout", 0)
+            self.last_sent = time.monotonic()
+            self.channel = ReliableChannel(self.session)
+            print(f"[REGISTERED] Identifier: {self.identifier}")
+        else:
+            print(f"[ERROR] Registration failed: {data['message']}")
+        return data["success"]
+
+    def encode(self, message):
+        self.last_sent = time.monotonic()
+        if self.wire == protocol.BINARY:
+            self.seq += 1
+            return protocol.encode(protocol.MSG_DATA, self.session, self.seq, protocol.encode_text(message))
+        return json.dumps({
+            "identifier": self.identifier,
+            "message": message
+        }).encode()
+
+    def encode_input(self, changes):
+        self.last_sent = time.monotonic()
+        if self.wire == protocol.BINARY:
+            self.seq += 1
+            return protocol.encode(protocol.MSG_INPUT, self.session, self.seq, json.dumps(changes).encode())
+        return json.dumps({"identifier": self.identifier, "input": changes}).encode()
+
+    def apply_state(self, data):
+        """
+        Apply a state update from the server, returns the ack to send back
+        """
+        if protocol.is_binary(data):
+            packet = protocol.decode(data)
+            tick = packet.seq
+            update = json.loads(packet.payload.decode())
+        else:
+            update = json.loads(data.decode())
+            tick = update["tick"]
+        with self.state_lock:
+            if update["base"] == 0:
+                self.state = {}
+            # Late (reordered) updates carry nothing newer than what we hold
+            if tick > self.state_tick or update["base"] == 0:
+                for key, value in update["state"].items():
+                    if value is None:
+                        self.state.pop(key, None)
+                    else:
+                        self.state[key] = value
+                self.state_tick = tick
+            tick = self.state_tick
+        self.last_sent = time.monotonic()
+        if self.wire == protocol.BINARY:
+            return protocol.encode(protocol.MSG_ACK, self.session, tick)
+        return json.dumps({"identifier": self.identifier, "ack": tick}).encode()
+
+    def encode_reliable(self, message):
+        """
+        Datagrams to send for a message on the reliable channel, may be none
+        while the window is full (poll() sends them later)
+        """
+        return self.channel.send(self.encode(message))
+
+    def unpack(self, data):
+        """
+        The datagrams carried by a received one, opening batches and the
+        reliable channel (whose payloads come out in order, exactly once).
+        A malformed batch is dropped whole.
+        """
+        datagrams = []
+        try:
+            batched = protocol.unbatch(data)
+        except protocol.ProtocolError as e:
+            print(f"[ERROR] Dropped malformed datagram: {e}")
+            return datagrams
+        for data in batched:
+            if protocol.is_reliable(data):
+                try:
+                    datagrams.extend(self.channel.receive(data))
+                except protocol.ProtocolError:
+                    pass
+            else:
+                datagrams.append(data)
+        return datagrams
+
+    def heartbeat_due(self):
+        """
+        True when nothing was sent for a third of the server idle timeout
+        """
+        return (self.identifier is not None and self.timeout > 0
+                and time.monotonic() - self.last_sent >= self.timeout / 3)
+
+    def encode_heartbeat(self):
+        self.last_sent = time.monotonic()
+        if self.wire == protocol.BINARY:
+            return protocol.encode(protocol.MSG_HEARTBEAT, self.session, self.seq)
+        return json.dumps({"heartbeat": 1, "identifier": self.identifier}).encode()
+
+    def get_state(self):
+        """
+        Copy of the room state last received from the server
+        """
+        with self.state_lock:
+            return dict(self.state)
+
+    def parse_data(self, data):
+        """
+        Parse response from server
+        """
+        if protocol.is_binary(data):
+            try:
+                packet = protocol.decode(data)
+                return {
+                    "session": packet.session,
+                    "seq": packet.seq,
+                    "message": packet.payload.decode(errors="replace")
+                }
+            except protocol.ProtocolError:
+                pass
+        try:
+            msg = json.loads(data.decode())
+        except ValueError:
+            msg = None
+        if isinstance(msg, dict):
+            return msg
+        # Whatever a peer sent, reading it must not raise
+        return {"message": data.decode(errors="replace")}
+
+
+class Client(BaseClient):
+    def __init__(self,
+                 server_host,
+                 server_port_tcp=12345,
+                 server_port_udp=54321,
+                 client_port_udp=0,  # 0 for dynamic UDP port allocation
+                 wire=protocol.BINARY,
+                 room=protocol.DEFAULT_ROOM,
+                 inbox_capacity=4096,
+                 overflow=DROP_OLDEST):
+        """
+        Create a game server client
+        """
+        super().__init__(server_host, server_port_tcp, server_port_udp, wire, room)
+
+        # One UDP socket for both directions, bound on every interface so replies
+        # reach it whichever address the server sees us on
         self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_sock.bind(self.client_udp)
+        self.udp_sock.bind(("", client_port_udp))
         self.client_udp = self.udp_sock.getsockname()  # Update with actual port if it was 0
 
-        self.server_message = []
-        self.lock = threading.Lock()
-        self.udp_thread = SocketThread(self.client_udp, self, self.lock)
+        self.inbox = Inbox(inbox_capacity, overflow)
+        self.udp_thread = SocketThread(self.udp_sock, self.receive, self.idle)
+
+        # Long-lived control connection, opened on first request
+        self.control = None
+        self.control_buffer = b""
+        self.control_lock = threading.Lock()
+
+    def pipeline(self, messages):
+        """
+        Send several control requests at once and wait for all the responses
+        """
+        with self.control_lock:
+            if self.control is None:
+                self.control = socket.create_connection((self.server_host, self.server_port_tcp))
+                self.control_buffer = b""
+            requests = [self.next_request(message) for message in messages]
+            self.control.sendall(b"".join(protocol.frame(request) for request in requests))
+            responses = {}
+            while True:
+                received, self.control_buffer = protocol.split_frames(self.control_buffer)
+                for response in received:
+                    responses[response.get("id")] = response
+                if all(request["id"] in responses for request in requests):
+                    return [responses[request["id"]] for request in requests]
+                data = self.control.recv(65536)
+                if not data:
+                    self.control.close()
+                    self.control = None
+                    raise ConnectionError("Control channel closed by server")
+                self.control_buffer += data
+
+    def request(self, message):
+        """
+        Send a control request and wait for its response
+        """
+        return self.pipeline([message])[0]
 
     def register(self):
         """
         Register the client to server and get a unique identifier
         """
-        message = json.dumps({
-            "action": "register",
-            "payload": self.client_udp[1]
-        })
-
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.server_host, self.server_port_tcp))
-            sock.send(message.encode())
-            response = sock.recv(1024).decode()
-            data = json.loads(response)
-            if data["success"]:
-                self.identifier = data["identifier"]
-                print(f"[REGISTERED] Identifier: {self.identifier}")
-            else:
-                print(f"[ERROR] Registration failed: {data['message']}")
-            sock.close()
+            self.registered(self.request(self.registration_request()))
         except Exception as e:
             print(f"[ERROR] TCP registration failed: {e}")
 
+    def join(self, room):
+        """
+        Move to another room
+        """
+        response = self.request({"action": "join", "payload": room})
+        if response["success"]:
+            self.room = response["room"]
+        return response["success"]
+
+    def leave(self):
+        """
+        Unregister from the server, the client can register again later
+        """
+        response = self.request({"action": "leave"})
+        self.identifier = None
+        return response["success"]
+
+    def ping(self):
+        """
+        Round-trip time of the control channel in seconds
+        """
+        started = time.perf_counter()
+        self.request({"action": "ping"})
+        return time.perf_counter() - started
+
     def send(self, message):
         """
         Send data to all players
@@ -61,40 +384,82 @@ class Client:
             print("[SEND] Client not registered!")
             return
 
-        msg = json.dumps({
-            "identifier": self.identifier,
-            "message": message
-        })
+        try:
+            self.udp_sock.sendto(self.encode(message), (self.server_host, self.server_port_udp))
+        except Exception as e:
+            print(f"[ERROR] UDP send failed: {e}")
+
+    def send_input(self, changes):
+        """
+        Send state changes to a tick-driven server
+        """
+        if not self.identifier:
+            print("[SEND] Client not registered!")
+            return
 
         try:
-            self.udp_sock.sendto(msg.encode(), (self.server_host, self.server_port_udp))
+            self.udp_sock.sendto(self.encode_input(changes), (self.server_host, self.server_port_udp))
         except Exception as e:
             print(f"[ERROR] UDP send failed: {e}")
 
-    def parse_data(self, data):
+    def send_reliable(self, message):
         """
-        Parse response from server
+        Send data to all players, delivered in order and exactly once
+        (moves of a turn-based game)
         """
+        if not self.identifier:
+            print("[SEND] Client not registered!")
+            return
+
         try:
-            msg = json.loads(data.decode())
-            return msg
-        except:
-            return {"message": data.decode()}
+            for data in self.encode_reliable(message):
+                self.udp_sock.sendto(data, (self.server_host, self.server_port_udp))
+            # Wake the receive thread often enough to retransmit
+            self.udp_sock.settimeout(POLL)
+        except Exception as e:
+            print(f"[ERROR] UDP send failed: {e}")
+
+    def idle(self):
+        """
+        Called by the receive thread between datagrams
+        """
+        self.heartbeat()
+        if self.channel.active():
+            try:
+                for data in self.channel.poll():
+                    self.udp_sock.sendto(data, (self.server_host, self.server_port_udp))
+            except Exception as e:
+                print(f"[ERROR] UDP send failed: {e}")
+        self.udp_sock.settimeout(POLL if self.channel.active() else self.udp_thread.interval)
+
+    def heartbeat(self):
+        """
+        Keep the registration alive while the game has nothing to send
+        """
+        if self.heartbeat_due():
+            try:
+                self.udp_sock.sendto(self.encode_heartbeat(), (self.server_host, self.server_port_udp))
+            except Exception as e:
+                print(f"[ERROR] Heartbeat failed: {e}")
+
+    def receive(self, data):
+        """
+        Handle a datagram from the receive thread
+        """
+        for data in self.unpack(data):
+            if protocol.is_state(data):
+                try:
+                    self.udp_sock.sendto(self.apply_state(data), (self.server_host, self.server_port_udp))
+                except Exception as e:
+                    print(f"[ERROR] State update failed: {e}")
+            else:
+                self.inbox.put(data)
 
     def get_messages(self):
         """
-        Get received messages from server
+        Get received messages from server, decoded lazily on access
         """
-        messages = []
-        self.lock.acquire()
-        try:
-            while self.server_message:
-                data = self.server_message.pop(0)
-                msg = self.parse_data(data)
-                messages.append(msg)
-        finally:
-            self.lock.release()
-        return messages
+        return Messages(self.inbox.drain(), self.parse_data)
 
     def run(self):
         """
@@ -107,21 +472,28 @@ class Client:
         Stop the client
         """
         self.udp_thread.stop()
-        self.udp_sock.close()
+        self.inbox.close()
+        with self.control_lock:
+            if self.control is not None:
+                self.control.close()
+                self.control = None
         print("[CLIENT] Stopped")
 
 
 class SocketThread(threading.Thread):
-    def __init__(self, addr, client, lock):
+    def __init__(self, sock, handler, idle=None, interval=0.5):
         """
-        Client UDP connection
+        Receive loop on the client UDP socket, idle() is called at least
+        every interval seconds
         """
         threading.Thread.__init__(self)
-        self.client = client
-        self.lock = lock
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(addr)
+        self.handler = handler
+        self.idle = idle
+        self.interval = interval
+        self.sock = sock
         self.is_running = True
+        if idle is not None:
+            self.sock.settimeout(interval)
 
     def run(self):
         """
@@ -129,20 +501,249 @@ class SocketThread(threading.Thread):
         """
         while self.is_running:
             try:
-                data, addr = self.sock.recvfrom(1024)
-                with self.lock:
-                    self.client.server_message.append(data)
-            except:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                data = None
+            except OSError:
+                # Socket closed by stop()
                 break
+            if data is not None:
+                try:
+                    self.handler(data)
+                except Exception as e:
+                    # A datagram the handler chokes on must not end the receive loop
+                    print(f"[ERROR] UDP receive failed: {e}")
+            if self.idle is not None:
+                self.idle()
 
     def stop(self):
         """
         Stop thread
         """
         self.is_running = False
+        try:
+            # Wakes up a recvfrom blocked in the thread, close() alone doesn't
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
 
 
+class AsyncClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def connection_made(self, transport):
+        self.client.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.client.receive(data)
+
+    def error_received(self, exc):
+        print(f"[ERROR] UDP receive failed: {exc}")
+
+    def connection_lost(self, exc):
+        self.client.receive(None)
+
+
+class AsyncClient(BaseClient):
+    def __init__(self,
+                 server_host,
+                 server_port_tcp=12345,
+                 server_port_udp=54321,
+                 client_port_udp=0,
+                 wire=protocol.BINARY,
+                 room=protocol.DEFAULT_ROOM,
+                 inbox_capacity=4096):
+        """
+        Game server client for asyncio code, no thread per client:
+        await register(), await send(), async for msg in client
+        """
+        super().__init__(server_host, server_port_tcp, server_port_udp, wire, room)
+        self.client_port_udp = client_port_udp
+        self.transport = None
+        self.inbox = asyncio.Queue(inbox_capacity)
+        self.dropped = 0
+        self.writer = None
+        self.reader_task = None
+        self.heartbeat_task = None
+        self.reliable_task = None
+        self.pending = {}
+
+    async def open(self):
+        """
+        Bind the UDP socket
+        """
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(
+            lambda: AsyncClientProtocol(self), local_addr=("0.0.0.0", self.client_port_udp))
+        self.client_udp = self.transport.get_extra_info("sockname")
+
+    async def read_responses(self, reader):
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                responses, buffer = protocol.split_frames(buffer + data)
+                for response in responses:
+                    future = self.pending.pop(response.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(response)
+        finally:
+            self.writer = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Control channel closed by server"))
+            self.pending.clear()
+
+    async def request(self, message):
+        """
+        Send a control request and wait for its response. Concurrent
+        requests are pipelined on the same connection.
+        """
+        if self.writer is None:
+            reader, self.writer = await asyncio.open_connection(self.server_host, self.server_port_tcp)
+            self.reader_task = asyncio.create_task(self.read_responses(reader))
+        request = self.next_request(message)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request["id"]] = future
+        self.writer.write(protocol.frame(request))
+        return await future
+
+    async def register(self):
+        """
+        Register the client to server and get a unique identifier
+        """
+        if self.transport is None:
+            await self.open()
+        success = self.registered(await self.request(self.registration_request()))
+        if success and self.timeout and self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self.heartbeats())
+        return success
+
+    async def heartbeats(self):
+        """
+        Keep the registration alive while the game has nothing to send
+        """
+        while True:
+            await asyncio.sleep(self.timeout / 6)
+            if self.heartbeat_due() and self.transport is not None:
+                self.transport.sendto(self.encode_heartbeat(), (self.server_host, self.server_port_udp))
+
+    async def join(self, room):
+        """
+        Move to another room
+        """
+        response = await self.request({"action": "join", "payload": room})
+        if response["success"]:
+            self.room = response["room"]
+        return response["success"]
+
+    async def leave(self):
+        """
+        Unregister from the server, the client can register again later
+        """
+        response = await self.request({"action": "leave"})
+        self.identifier = None
+        return response["success"]
+
+    async def ping(self):
+        """
+        Round-trip time of the control channel in seconds
+        """
+        started = time.perf_counter()
+        await self.request({"action": "ping"})
+        return time.perf_counter() - started
+
+    async def send(self, message):
+        """
+        Send data to all players
+        """
+        if not self.identifier:
+            print("[SEND] Client not registered!")
+            return
+        self.transport.sendto(self.encode(message), (self.server_host, self.server_port_udp))
+
+    async def send_input(self, changes):
+        """
+        Send state changes to a tick-driven server
+        """
+        if not self.identifier:
+            print("[SEND] Client not registered!")
+            return
+        self.transport.sendto(self.encode_input(changes), (self.server_host, self.server_port_udp))
+
+    async def send_reliable(self, message):
+        """
+        Send data to all players, delivered in order and exactly once
+        (moves of a turn-based game)
+        """
+        if not self.identifier:
+            print("[SEND] Client not registered!")
+            return
+        for data in self.encode_reliable(message):
+            self.transport.sendto(data, (self.server_host, self.server_port_udp))
+        self.poll_reliable()
+
+    def poll_reliable(self):
+        # The retransmission task only runs while the channel is active
+        if self.reliable_task is None and self.channel.active():
+            self.reliable_task = asyncio.get_running_loop().create_task(self.retransmit())
+
+    async def retransmit(self):
+        try:
+            while self.channel.active() and self.transport is not None:
+                await asyncio.sleep(POLL)
+                for data in self.channel.poll():
+                    self.transport.sendto(data, (self.server_host, self.server_port_udp))
+        finally:
+            self.reliable_task = None
+
+    def receive(self, data):
+        datagrams = self.unpack(data) if data is not None else [None]
+        if data is not None:
+            # Acks are owed for what just arrived
+            self.poll_reliable()
+        for data in datagrams:
+            if data is not None and protocol.is_state(data):
+                try:
+                    self.transport.sendto(self.apply_state(data), (self.server_host, self.server_port_udp))
+                except Exception as e:
+                    print(f"[ERROR] State update failed: {e}")
+                continue
+            if self.inbox.full():
+                # Drop the oldest message, like the threaded client's default policy
+                self.inbox.get_nowait()
+                self.dropped += 1
+            self.inbox.put_nowait(data)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.inbox.get()
+        if data is None:
+            raise StopAsyncIteration
+        return self.parse_data(data)
+
+    def close(self):
+        """
+        Stop the client, ends the message stream
+        """
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        if self.reliable_task is not None:
+            self.reliable_task.cancel()
+        if self.transport is not None:
+            self.transport.close()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
 if __name__ == "__main__":
     """
     Example with 4 clients
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+"""
+Even Hunt without pygame: the numbers 1..2n on the board, two of them are
+replaced by their difference until one is left. a + b and |a - b| have the
+same parity, so the parity of the sum never changes and the last number is
+odd exactly when n(2n + 1) is, i.e. when n is odd.
+
+    python evenhunt.py --n 101 --games 1000000
+"""
+
+import argparse
+import json
+import time
+from array import array
+import numpy as np
+
+
+class EvenHunt:
+
+    def __init__(self, n):
+        """
+        The board is the prefix values[:size] of a flat integer array, a
+        removed number is replaced by the last one so nothing shifts
+        """
+        self.n = n
+        self.values = array("q", range(1, 2 * n + 1))
+        self.size = 2 * n
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, slot):
+        if not 0 <= slot < self.size:
+            raise IndexError(slot)
+        return self.values[slot]
+
+    def done(self):
+        return self.size == 1
+
+    def result(self):
+        return self.values[0] if self.done() else None
+
+    def replace(self, first, second):
+        """
+        Replace the numbers in two slots by their difference, kept in the
+        lower slot. Returns the slots whose number changed or went away.
+        """
+        if first == second or not (0 <= first < self.size and 0 <= second < self.size):
+            raise ValueError(f"Cannot replace slots {first} and {second}")
+        keep, remove = min(first, second), max(first, second)
+        values = self.values
+        values[keep] = abs(values[first] - values[second])
+        last = self.size - 1
+        values[remove] = values[last]
+        self.size = last
+        return (keep, remove) if remove == last else (keep, remove, last)
+
+    def predicted(self):
+        """
+        Parity of the last number, known from the start
+        """
+        return self.n * (2 * self.n + 1) % 2
+
+
+def simulate(n, games, batch=20000, seed=None):
+    """
+    Play games random games of size n, batch of them at once as the rows of
+    a NumPy array, all boards shrink in lockstep
+    """
+    rng = np.random.default_rng(seed)
+    finals = {0: 0, 1: 0}
+    largest = 0
+    rows = np.arange(min(batch, games))
+    played = 0
+    while played < games:
+        count = min(batch, games - played)
+        row = rows[:count]
+        boards = np.tile(np.arange(1, 2 * n + 1, dtype=np.int32), (count, 1))
+        for size in range(2 * n, 1, -1):
+            first = rng.integers(0, size, count)
+            second = rng.integers(0, size - 1, count)
+            second += second >= first
+            keep = np.minimum(first, second)
+            remove = np.maximum(first, second)
+            difference = np.abs(boards[row, first] - boards[row, second])
+            boards[row, keep] = difference
+            boards[row, remove] = boards[:count, size - 1]
+        last = boards[:, 0]
+        odd = int(np.count_nonzero(last & 1))
+        finals[1] += odd
+        finals[0] += count - odd
+        largest = max(largest, int(last.max()))
+        played += count
+    return finals, largest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the parity invariant of Even Hunt on random games")
+    parser.add_argument("--n", type=int, default=101, help="Board of the numbers 1..2n")
+    parser.add_argument("--games", type=int, default=1000000, help="Random games to play")
+    parser.add_argument("--batch", type=int, default=20000, help="Games played at once")
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    finals, largest = simulate(args.n, args.games, args.batch, args.seed)
+    elapsed = time.perf_counter() - started
+    predicted = EvenHunt(args.n).predicted()
+    report = {
+        "n": args.n,
+        "games": args.games,
+        "odd": finals[1],
+        "even": finals[0],
+        "predicted": "odd" if predicted else "even",
+        "invariant_held": finals[1 - predicted] == 0,
+        "largest_final": largest,
+        "seconds": round(elapsed, 3),
+        "games_per_sec": round(args.games / elapsed) if elapsed else None
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import pygame
 import sys
-import random
+from nim import RED, is_legal, best_move
+from render import Display, texts
+from particles import Confetti
+from assets import assets
 
 # --- Setup ---
 pygame.init()
@@ -15,8 +18,7 @@ BG_COLOR = (30, 30, 30)
 
 # --- Load Intro Image ---
 try:
-    intro_image = pygame.image.load("intro.png").convert_alpha()
-    intro_image = pygame.transform.scale(intro_image, (400, 300))
+    intro_image = assets.image("intro.png", (400, 300), alpha=True)
 except:
     intro_image = pygame.Surface((400, 300))
     intro_image.fill((200, 50, 50))  # placeholder if image not found
@@ -28,26 +30,13 @@ intro_lines = [
     "Jeu de Nim — Moroccan Day of Mathematics"
 ]
 
-# --- Confetti & Fireworks Class ---
-class ConfettiParticle:
-    def __init__(self):
-        self.x = random.randint(0, WIDTH)
-        self.y = random.randint(-HEIGHT, 0)
-        self.size = random.randint(4, 8)
-        self.color = random.choice([(255,0,0), (0,255,0), (0,255,255), (255,255,0), (255,105,180)])
-        self.speed = random.uniform(1, 3)
-
-    def update(self):
-        self.y += self.speed
-        if self.y > HEIGHT:
-            self.y = random.randint(-HEIGHT, 0)
-            self.x = random.randint(0, WIDTH)
-
-    def draw(self, surface):
-        pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), self.size)
+# --- Confetti & Fireworks ---
+CONFETTI = 100  # flying bits, thousands are fine
 
 # --- Restart Button ---
 BUTTON_RECT = pygame.Rect(WIDTH // 2 - 60, HEIGHT - 80, 120, 50)
+HINT_RECT = pygame.Rect(WIDTH // 2 - 220, HEIGHT - 80, 120, 50)
+AI_RECT = pygame.Rect(WIDTH // 2 + 100, HEIGHT - 80, 120, 50)
 
 # --- Game Config ---
 ROWS = 7
@@ -56,6 +45,7 @@ MATCH_HEIGHT = 100
 MATCH_WIDTH = 20
 GAP_Y = 100
 GAP_X = 60
+AI_DELAY = 700  # ms before the computer plays
 
 # --- Generate pyramid match positions ---
 matches = []
@@ -76,7 +66,9 @@ for row in range(ROWS):
 selected = []
 current_player = 1
 game_over = False
-confetti = [ConfettiParticle() for _ in range(100)]  # 100 flying bits
+confetti = Confetti(CONFETTI, WIDTH, HEIGHT)
+vs_ai = False  # single player: the computer is player 2
+ai_due = 0
 
 # --- Draw Matches ---
 def draw_matches():
@@ -91,30 +83,71 @@ def draw_matches():
 
 def draw_button():
     pygame.draw.rect(screen, (0, 120, 250), BUTTON_RECT, border_radius=8)
-    label = FONT.render("Restart", True, (255, 255, 255))
+    label = texts.render("Restart", FONT, (255, 255, 255))
     screen.blit(label, (BUTTON_RECT.x + 15, BUTTON_RECT.y + 10))
 
+def draw_options():
+    for rect, text in ((HINT_RECT, "Hint"), (AI_RECT, "vs AI" if vs_ai else "2 Pl.")):
+        pygame.draw.rect(screen, (0, 160, 120), rect, border_radius=8)
+        label = texts.render(text, FONT, (255, 255, 255))
+        screen.blit(label, label.get_rect(center=rect.center))
+
 def draw_text(text):
-    label = FONT.render(text, True, (255, 255, 255))
+    label = texts.render(text, FONT, (255, 255, 255))
     screen.blit(label, (WIDTH // 2 - label.get_width() // 2, 30))
 
 # --- Game Logic ---
+def board_state():
+    state = 0
+    for match in matches:
+        if match["alive"]:
+            state |= 1 << match["index"]
+    return state
+
+def take(move):
+    global current_player, game_over, ai_due
+    for match in matches:
+        if move >> match["index"] & 1:
+            match["alive"] = False
+    if move & RED:  # red match taken
+        game_over = True
+    else:
+        current_player = 2 if current_player == 1 else 1
+        ai_due = pygame.time.get_ticks() + AI_DELAY
+
 def handle_done():
-    global current_player, game_over
-    if 1 <= len(selected) <= 3:
-        for idx in selected:
-            matches[idx]["alive"] = False
-        if not matches[0]["alive"]:  # red match taken
-            game_over = True
-        else:
-            current_player = 2 if current_player == 1 else 1
+    move = sum(1 << idx for idx in selected)
+    if is_legal(board_state(), move):
+        take(move)
     selected.clear()
 
+def show_hint():
+    move = best_move(board_state())
+    selected[:] = [m["index"] for m in matches if move >> m["index"] & 1]
+
+def ai_turn():
+    return vs_ai and current_player == 2 and not game_over
+
+# --- Fireworks over the finished board ---
+def celebrate(board, shown):
+    winner_text = texts.render(f"🎉 Player {current_player} wins! 🎉", BIG_FONT, (255, 255, 255))
+    winner_rect = winner_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
+    # Erase the last frame's particles and text, then draw the new ones
+    display.restore(board, winner_rect)
+    display.mark_many(confetti.erase(screen, board))
+    confetti.update()
+    display.mark_many(confetti.draw(screen))
+    # Show Flipping Text for Victory (centered and bigger)
+    if shown:
+        screen.blit(winner_text, winner_rect)
+
 # --- Show Intro ---
 def show_intro():
     start_time = pygame.time.get_ticks()
     fade_duration = 5000  # 5 seconds
     clock = pygame.time.Clock()
+    # Rendered once, only their alpha changes
+    lines = [BIG_FONT.render(line, True, (255, 255, 255)) for line in intro_lines]
 
     running = True
     while running:
@@ -130,13 +163,11 @@ def show_intro():
         screen.fill(BG_COLOR)
 
         # Draw and fade image
-        img = intro_image.copy()
-        img.set_alpha(alpha)
-        screen.blit(img, intro_rect)
+        intro_image.set_alpha(alpha)
+        screen.blit(intro_image, intro_rect)
 
         # Draw and fade text
-        for i, line in enumerate(intro_lines):
-            text = BIG_FONT.render(line, True, (255, 255, 255))
+        for i, text in enumerate(lines):
             text.set_alpha(alpha)
             rect = text.get_rect(center=(WIDTH // 2, HEIGHT - 180 + i * 50))
             screen.blit(text, rect)
@@ -148,46 +179,49 @@ def show_intro():
             running = False
 
 # --- Main Game Loop ---
+assets.report()
 show_intro()
 
-while True:
-    screen.fill(BG_COLOR)
-    draw_matches()
+# The screen is only repainted after a change, the fireworks only where they move
+display = Display(screen)
+board = None
+clock = pygame.time.Clock()
 
-    # --- Victory Message Update ---
-    if game_over:
-        # Show Fireworks
-        for c in confetti:
-            c.update()
-            c.draw(screen)
-
-        # Show Flipping Text for Victory (centered and bigger)
-        if pygame.time.get_ticks() % 1000 < 500:
-            # Use a larger font for the victory message
-            winner_text = BIG_FONT.render(f"🎉 Player {current_player} wins! 🎉", True, (255, 255, 255))
-            
-            # Center the text horizontally and vertically
-            winner_rect = winner_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            screen.blit(winner_text, winner_rect)
-
-        # Trophy Image (you can replace it with a better image)
-        trophy = FONT.render("🏆", True, (255, 215, 0))
-        screen.blit(trophy, (WIDTH // 2 - trophy.get_width() // 2, HEIGHT // 2 + 50))
+while True:
+    if ai_turn() and pygame.time.get_ticks() >= ai_due:
+        selected.clear()
+        take(best_move(board_state()))
+        display.invalidate()
 
+    if display.full:
+        screen.fill(BG_COLOR)
+        draw_matches()
         draw_button()  # Restart Button
 
+        if game_over:
+            # Trophy Image (you can replace it with a better image)
+            trophy = texts.render("🏆", FONT, (255, 215, 0))
+            screen.blit(trophy, (WIDTH // 2 - trophy.get_width() // 2, HEIGHT // 2 + 50))
+            board = screen.copy()
+        else:
+            draw_options()
+            draw_text("Computer's turn" if ai_turn() else f"Player {current_player}'s turn")
 
-    else:
-        draw_button()  # Restart Button
-        draw_text(f"Player {current_player}'s turn")
+    # --- Victory Message Update ---
+    if game_over:
+        celebrate(board, pygame.time.get_ticks() % 1000 < 500)
 
-    pygame.display.flip()
+    display.present()
+    clock.tick(60)
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             pygame.quit()
             sys.exit()
 
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            display.invalidate()
+
         if game_over:
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if BUTTON_RECT.collidepoint(event.pos):
@@ -209,14 +243,21 @@ while True:
                     selected.clear()
                     current_player = 1
                     game_over = False
-                    confetti = [ConfettiParticle() for _ in range(100)]  # Reset fireworks
+                    confetti = Confetti(CONFETTI, WIDTH, HEIGHT)  # Reset fireworks
                 continue
 
         if game_over:
             continue
 
         if event.type == pygame.MOUSEBUTTONDOWN:
-            if BUTTON_RECT.collidepoint(event.pos):
+            if AI_RECT.collidepoint(event.pos):
+                vs_ai = not vs_ai
+                ai_due = pygame.time.get_ticks() + AI_DELAY
+            elif ai_turn():
+                continue
+            elif HINT_RECT.collidepoint(event.pos):
+                show_hint()
+            elif BUTTON_RECT.collidepoint(event.pos):
                 handle_done()
             else:
                 for m in matches:
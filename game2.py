@@ -3,6 +3,9 @@ import sys
 import random
 import tkinter as tk
 from tkinter import simpledialog
+from render import Display, texts
+from assets import assets
+from evenhunt import EvenHunt
 
 # Initialize Pygame
 pygame.init()
@@ -23,12 +26,12 @@ GRAY = (180, 180, 180)
 GREEN = (0, 255, 0)
 
 # Load intro image
-intro_image = pygame.image.load("intro.png")
-intro_image = pygame.transform.scale(intro_image, (WIDTH, HEIGHT))
+intro_image = assets.image("intro.png", (WIDTH, HEIGHT))
+assets.report()
 
 # Helper function to draw text
 def draw_text(text, font, color, surface, x, y):
-    textobj = font.render(text, True, color)
+    textobj = texts.render(text, font, color)
     textrect = textobj.get_rect(center=(x, y))
     surface.blit(textobj, textrect)
 
@@ -37,6 +40,108 @@ def draw_button(rect, text, surface):
     pygame.draw.rect(surface, WHITE, rect)
     draw_text(text, SMALL_FONT, BLACK, surface, rect.centerx, rect.centery)
 
+# Table layout: slot i of the board always sits in the same cell, only
+# the rows inside VIEW are drawn, scrolled with the wheel or Page Up/Down
+# and zoomed with +/-
+SPACING = 80
+CELL = 60
+MAX_COLS = 8
+VIEW = pygame.Rect(0, 150, WIDTH, HEIGHT - 320)
+ZOOMS = (0.5, 1, 2)
+CELL_FONTS = {zoom: SMALL_FONT if zoom == 1 else pygame.font.SysFont(None, int(32 * zoom)) for zoom in ZOOMS}
+
+class Table:
+    def __init__(self, n):
+        self.n = n
+        self.zoom = 1
+        self.scroll = 0
+        self.layout()
+
+    def layout(self):
+        self.spacing = int(SPACING * self.zoom)
+        self.cell = int(CELL * self.zoom)
+        self.cols = min(int(MAX_COLS / self.zoom), 2 * self.n)  # 8 columns at zoom 1
+        self.start_x = (WIDTH - self.cols * self.spacing) // 2
+        self.font = CELL_FONTS[self.zoom]
+
+    def height(self, count):
+        return (count + self.cols - 1) // self.cols * self.spacing
+
+    def clamp(self, count):
+        """
+        Keep the scroll inside the board, returns whether it moved
+        """
+        scroll = max(0, min(self.scroll, self.height(count) - VIEW.height))
+        moved = scroll != self.scroll
+        self.scroll = scroll
+        return moved
+
+    def scroll_by(self, pixels, count):
+        before = self.scroll
+        self.scroll += pixels
+        self.clamp(count)
+        return self.scroll != before
+
+    def zoom_by(self, step, count):
+        index = ZOOMS.index(self.zoom) + step
+        if not 0 <= index < len(ZOOMS):
+            return False
+        # The first row in sight stays at the top
+        first = self.scroll // self.spacing * self.cols
+        self.zoom = ZOOMS[index]
+        self.layout()
+        self.scroll = first // self.cols * self.spacing
+        self.clamp(count)
+        return True
+
+    def rect(self, slot):
+        row, col = divmod(slot, self.cols)
+        return pygame.Rect(self.start_x + col * self.spacing, VIEW.y + row * self.spacing - self.scroll,
+                           self.cell, self.cell)
+
+    def visible(self, count):
+        first = self.scroll // self.spacing
+        last = (self.scroll + VIEW.height) // self.spacing + 1
+        return range(first * self.cols, min(count, last * self.cols))
+
+    def slot_at(self, pos):
+        if not VIEW.collidepoint(pos):
+            return None
+        col, x = divmod(pos[0] - self.start_x, self.spacing)
+        row, y = divmod(pos[1] - VIEW.y + self.scroll, self.spacing)
+        if 0 <= col < self.cols and x < self.cell and y < self.cell:
+            return row * self.cols + col
+        return None
+
+# Helper function to draw one number of the table, returns the region drawn
+def draw_cell(game, table, slot, selected, surface):
+    rect = table.rect(slot)
+    area = rect.clip(VIEW)
+    if not area:
+        return None
+    if area != rect:
+        surface.set_clip(area)  # a row cut by the edge of the view
+    if slot < len(game):
+        color = GREEN if slot in selected else GRAY
+        pygame.draw.rect(surface, color, rect)
+        draw_text(str(game[slot]), table.font, BLACK, surface, rect.centerx, rect.centery)
+    else:
+        surface.fill(BLACK, rect)
+    surface.set_clip(None)
+    return area
+
+# Helper function to draw the rows in sight and the scrollbar
+def draw_table(game, table, selected, surface):
+    surface.fill(BLACK, VIEW)
+    for slot in table.visible(len(game)):
+        draw_cell(game, table, slot, selected, surface)
+    height = table.height(len(game))
+    if height > VIEW.height:
+        bar = pygame.Rect(WIDTH - 20, VIEW.y + table.scroll * VIEW.height // height,
+                          6, max(10, VIEW.height * VIEW.height // height))
+        pygame.draw.rect(surface, GRAY, bar)
+    return VIEW
+
 # Get odd input from user via tkinter dialog
 def get_odd_n():
     root = tk.Tk()
@@ -52,104 +157,111 @@ def get_odd_n():
 def run_game(n, skip_intro=False):
     show_intro = not skip_intro
     intro_start = pygame.time.get_ticks()
-    game_done = False
-    selected = []
-
-    numbers = list(range(1, 2 * n + 1))
-    table_buttons = []
-    spacing = 80
-    cols = min(8, 2 * n)  # Limit columns to at most 8
-    rows = (2 * n + cols - 1) // cols
-
-    total_width = cols * spacing
-    total_height = rows * spacing
-    start_x = (WIDTH - total_width) // 2
-    start_y = 150
-
-    for i, val in enumerate(numbers):
-        row = i // cols
-        col = i % cols
-        rect = pygame.Rect(start_x + col * spacing, start_y + row * spacing, 60, 60)
-        table_buttons.append({'rect': rect, 'value': val})
+    game = EvenHunt(n)
+    table = Table(n)
+    selected = []  # slots
 
     restart_button = pygame.Rect(WIDTH//2 - 100, HEIGHT - 100, 200, 50)
     replace_button = pygame.Rect(WIDTH//2 - 100, HEIGHT - 160, 200, 40)
 
     title_displayed = False
+    # Repaint everything after a layout change, a single cell when it is (un)selected
+    display = Display(screen)
+    clock = pygame.time.Clock()
 
     while True:
-        screen.fill(BLACK)
-
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
-            elif event.type == pygame.MOUSEBUTTONDOWN and not game_done:
-                for btn in table_buttons:
-                    if btn['value'] != "" and btn['rect'].collidepoint(event.pos):
-                        if btn in selected:
-                            selected.remove(btn)  # unselect if already selected
-                        elif len(selected) < 2:
-                            selected.append(btn)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button > 3:
+                pass  # wheel, also reported as MOUSEWHEEL
+            elif event.type == pygame.MOUSEWHEEL and not show_intro:
+                if table.scroll_by(-event.y * table.spacing, len(game)):
+                    display.mark(draw_table(game, table, selected, screen))
+            elif event.type == pygame.KEYDOWN and not show_intro:
+                if event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                    page = VIEW.height - table.spacing
+                    moved = table.scroll_by(page if event.key == pygame.K_PAGEDOWN else -page, len(game))
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    moved = table.zoom_by(1, len(game))
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    moved = table.zoom_by(-1, len(game))
+                else:
+                    moved = False
+                if moved:
+                    display.mark(draw_table(game, table, selected, screen))
+            elif event.type == pygame.MOUSEBUTTONDOWN and not game.done():
+                slot = table.slot_at(event.pos)
+                if slot is not None and slot < len(game):
+                    if slot in selected:
+                        selected.remove(slot)  # unselect if already selected
+                    elif len(selected) < 2:
+                        selected.append(slot)
+                    if not show_intro:
+                        display.mark(draw_cell(game, table, slot, selected, screen))
+                        screen.fill(BLACK, replace_button)
+                        if len(selected) == 2:
+                            draw_button(replace_button, "Replace", screen)
+                        display.mark(replace_button)
 
                 if replace_button.collidepoint(event.pos) and len(selected) == 2:
-                    a = selected[0]['value']
-                    b = selected[1]['value']
-                    diff = abs(a - b)
-
-                    index1 = table_buttons.index(selected[0])
-                    index2 = table_buttons.index(selected[1])
-
-                    keep_index = min(index1, index2)
-                    remove_index = max(index1, index2)
-
-                    table_buttons[keep_index]['value'] = diff
-                    table_buttons.pop(remove_index)
-
+                    # Only the cells whose number changed or went away are redrawn
+                    changed = game.replace(*selected)
                     selected = []
+                    if game.done() or show_intro:
+                        display.invalidate()
+                    elif table.clamp(len(game)):
+                        display.mark(draw_table(game, table, selected, screen))
+                        screen.fill(BLACK, replace_button)
+                        display.mark(replace_button)
+                    else:
+                        for slot in changed:
+                            display.mark(draw_cell(game, table, slot, selected, screen))
+                        screen.fill(BLACK, replace_button)
+                        display.mark(replace_button)
 
-                    # Re-layout
-                    for i, btn in enumerate(table_buttons):
-                        row = i // cols
-                        col = i % cols
-                        btn['rect'] = pygame.Rect(start_x + col * spacing, start_y + row * spacing, 60, 60)
-
-                    if len(table_buttons) == 1:
-                        game_done = True
-
-            elif event.type == pygame.MOUSEBUTTONDOWN and game_done:
+            elif event.type == pygame.MOUSEBUTTONDOWN and game.done():
                 if restart_button.collidepoint(event.pos):
-                    run_game(n, skip_intro=True)
+                    # A new board in the same loop, no intro
+                    game = EvenHunt(n)
+                    selected = []
+                    table.scroll = 0
+                    display.invalidate()
 
         if show_intro:
             if not title_displayed:
-                draw_text("Even Hunt", TITLE_FONT, WHITE, screen, WIDTH//2, HEIGHT//2 - 50)
                 if pygame.time.get_ticks() - intro_start > 2000:
                     title_displayed = True
                     intro_start = pygame.time.get_ticks()
+                    display.invalidate()
+            elif pygame.time.get_ticks() - intro_start > 5000:
+                show_intro = False
+                display.invalidate()
+
+        if display.full:
+            screen.fill(BLACK)
+            if show_intro:
+                if not title_displayed:
+                    draw_text("Even Hunt", TITLE_FONT, WHITE, screen, WIDTH//2, HEIGHT//2 - 50)
+                else:
+                    screen.blit(intro_image, (0, 0))
             else:
-                screen.blit(intro_image, (0, 0))
-                if pygame.time.get_ticks() - intro_start > 5000:
-                    show_intro = False
-        else:
-            draw_text("Even Hunt", TITLE_FONT, WHITE, screen, WIDTH//2, 60)
-
-            for btn in table_buttons:
-                color = GREEN if btn in selected else GRAY
-                pygame.draw.rect(screen, color, btn['rect'])
-                if btn['value'] != "":
-                    draw_text(str(btn['value']), SMALL_FONT, BLACK, screen, btn['rect'].centerx, btn['rect'].centery)
-
-            if len(selected) == 2 and not game_done:
-                draw_button(replace_button, "Replace", screen)
-
-            if game_done:
-                final_value = table_buttons[0]['value']
-                result_text = f"Final number: {final_value} - It's {'Even' if final_value % 2 == 0 else 'Odd'}!"
-                draw_text(result_text, FONT, RED, screen, WIDTH//2, HEIGHT//2)
-                draw_button(restart_button, "Restart", screen)
-
-        pygame.display.flip()
+                draw_text("Even Hunt", TITLE_FONT, WHITE, screen, WIDTH//2, 60)
+
+                draw_table(game, table, selected, screen)
+
+                if len(selected) == 2 and not game.done():
+                    draw_button(replace_button, "Replace", screen)
+
+                if game.done():
+                    final_value = game.result()
+                    result_text = f"Final number: {final_value} - It's {'Even' if final_value % 2 == 0 else 'Odd'}!"
+                    draw_text(result_text, FONT, RED, screen, WIDTH//2, HEIGHT//2)
+                    draw_button(restart_button, "Restart", screen)
+
+        display.present()
+        clock.tick(60)
 
 # Initial setup
 n = get_odd_n()
@@ -2,6 +2,11 @@ import pygame
 import math
 import sys
 import time
+from functools import lru_cache
+import numpy as np
+from render import Display, texts
+from assets import assets
+from magiccircle import MagicCircle
 
 pygame.init()
 
@@ -19,68 +24,117 @@ SECTOR_COLOR = (100, 100, 255)
 BUTTON_COLOR = (180, 180, 180)
 HOVER_COLOR = (160, 160, 160)
 
-# Game state
-nums = [1, 0, 1, 0, 0, 0]
-num_sectors = 6
+# Game state, any number of sectors works
+START = [1, 0, 1, 0, 0, 0]
+circle = MagicCircle(START)
+num_sectors = len(circle)
 radius = 200
 center = (400, HEIGHT // 2)  # Adjusted for wider screen
 
 intro_phase = 0  # 0 = show image, 1 = show title, 2 = done
 intro_start_time = time.time()
 intro_shown = True
-intro_image = pygame.image.load("intro.png")
-intro_image = pygame.transform.scale(intro_image, (WIDTH, HEIGHT))
+intro_image = assets.image("intro.png", (WIDTH, HEIGHT))
 
 # Buttons (on the right side)
 buttons = {
     "check": pygame.Rect(900, 100, 200, 50),
     "invariant": pygame.Rect(900, 170, 200, 50),
-    "reset": pygame.Rect(900, 240, 200, 50)
+    "reset": pygame.Rect(900, 240, 200, 50),
+    "solve": pygame.Rect(900, 310, 200, 50)
 }
 
 # Messages
 message = ""
 message_timer = 0
+MESSAGE_RECT = pygame.Rect(WIDTH - 300, HEIGHT - 40, 300, 40)
+
+# Only the regions that changed are repainted
+display = Display(screen)
+hovered = None
+label_rects = {}  # sector -> where its number was drawn
+
+class SectorGeometry:
+    def __init__(self, num_sectors, radius, center):
+        """
+        Everything that only depends on the shape of the circle: the sectors
+        drawn without their numbers, where the numbers go, and the sector
+        under every pixel of the bounding square (-1 outside the circle)
+        """
+        self.rect = pygame.Rect(center[0] - radius - 2, center[1] - radius - 2, 2 * radius + 5, 2 * radius + 5)
+        angle_per_sector = 2 * math.pi / num_sectors
+        arc_points = max(2, 96 // num_sectors)
+
+        self.layer = pygame.Surface((WIDTH, HEIGHT))
+        self.layer.fill(WHITE)
+        self.labels = []
+        for i in range(num_sectors):
+            points = [center]
+            for step in range(arc_points + 1):
+                angle = (i + step / arc_points) * angle_per_sector
+                points.append((center[0] + radius * math.cos(angle), center[1] + radius * math.sin(angle)))
+            pygame.draw.polygon(self.layer, SECTOR_COLOR, points)
+            pygame.draw.polygon(self.layer, BLACK, points, 2)
+
+            angle_mid = (i + 0.5) * angle_per_sector
+            self.labels.append((center[0] + (radius // 2) * math.cos(angle_mid),
+                                center[1] + (radius // 2) * math.sin(angle_mid)))
+
+        dy, dx = np.mgrid[self.rect.top:self.rect.bottom, self.rect.left:self.rect.right]
+        dx -= center[0]
+        dy -= center[1]
+        angle = np.arctan2(dy, dx) % (2 * math.pi)
+        sectors = np.minimum((angle / angle_per_sector).astype(np.int16), num_sectors - 1)
+        self.mask = np.where(dx * dx + dy * dy <= radius * radius, sectors, -1)
+
+    def sector_at(self, pos):
+        x, y = pos[0] - self.rect.x, pos[1] - self.rect.y
+        if 0 <= x < self.rect.width and 0 <= y < self.rect.height and self.mask[y, x] >= 0:
+            return int(self.mask[y, x])
+        return None
+
+@lru_cache(maxsize=1)
+def sector_geometry(num_sectors, radius, center):
+    # Built again only when the shape of the circle changes
+    return SectorGeometry(num_sectors, radius, center)
 
 def draw_circle_sectors():
-    angle_per_sector = 2 * math.pi / num_sectors
-    for i in range(num_sectors):
-        start_angle = i * angle_per_sector
-        end_angle = (i + 1) * angle_per_sector
-
-        points = [center]
-        for angle in [start_angle, end_angle]:
-            x = center[0] + radius * math.cos(angle)
-            y = center[1] + radius * math.sin(angle)
-            points.append((x, y))
-
-        pygame.draw.polygon(screen, SECTOR_COLOR, points)
-        pygame.draw.polygon(screen, BLACK, points, 2)
-
-        # Draw the number
-        angle_mid = (start_angle + end_angle) / 2
-        text_x = center[0] + (radius // 2) * math.cos(angle_mid)
-        text_y = center[1] + (radius // 2) * math.sin(angle_mid)
-        text = font.render(str(nums[i]), True, BLACK)
-        text_rect = text.get_rect(center=(text_x, text_y))
-        screen.blit(text, text_rect)
+    geometry = sector_geometry(num_sectors, radius, center)
+    display.restore(geometry.layer, geometry.rect)
+    label_rects.clear()
+    draw_labels(range(num_sectors))
+
+def draw_labels(sectors):
+    """
+    Redraw the numbers of some sectors over the cached circle
+    """
+    geometry = sector_geometry(num_sectors, radius, center)
+    # A long number can reach into a neighbour's label, redraw those too
+    redraw = set(sectors)
+    while True:
+        erased = [label_rects[i] for i in redraw if i in label_rects]
+        overlapping = {i for i, rect in label_rects.items() if rect.collidelist(erased) >= 0}
+        if overlapping <= redraw:
+            break
+        redraw |= overlapping
+    for rect in erased:
+        display.restore(geometry.layer, rect)
+    for i in redraw:
+        text = texts.render(str(circle.nums[i]), font, BLACK)
+        label_rects[i] = screen.blit(text, text.get_rect(center=geometry.labels[i]))
+        display.mark(label_rects[i])
 
 def get_sector_from_pos(pos):
-    dx, dy = pos[0] - center[0], pos[1] - center[1]
-    angle = (math.atan2(dy, dx) + 2 * math.pi) % (2 * math.pi)
-    sector = int(angle / (2 * math.pi / num_sectors))
-    return sector
+    return sector_geometry(num_sectors, radius, center).sector_at(pos)
 
 def increase_neighbors(sector):
-    nums[sector] += 1
-    nums[(sector + 1) % num_sectors] += 1
+    circle.move(sector)
 
 def all_equal():
-    return all(n == nums[0] for n in nums)
+    return circle.all_equal()
 
 def compute_invariant():
-    signs = [1, -1, 1, -1, 1, -1]
-    return sum(signs[i] * nums[i] for i in range(6))
+    return circle.invariant()
 
 def draw_buttons():
     mouse = pygame.mouse.get_pos()
@@ -89,65 +143,84 @@ def draw_buttons():
         pygame.draw.rect(screen, color, rect)
         pygame.draw.rect(screen, BLACK, rect, 2)
         label = name.capitalize() if name != "check" else "Check Equal"
-        text = font.render(label, True, BLACK)
+        text = texts.render(label, font, BLACK)
         text_rect = text.get_rect(center=rect.center)
         screen.blit(text, text_rect)
+        display.mark(rect)
+
+def update_hover():
+    global hovered
+    mouse = pygame.mouse.get_pos()
+    now = next((name for name, rect in buttons.items() if rect.collidepoint(mouse)), None)
+    if now != hovered:
+        hovered = now
+        draw_buttons()
 
 def show_message(msg):
     global message, message_timer
     message = msg
     message_timer = time.time()
+    refresh_message()
+
+def refresh_message():
+    screen.fill(WHITE, MESSAGE_RECT)
+    draw_message()
+    display.mark(MESSAGE_RECT)
+
+def update_message():
+    global message
+    if message and time.time() - message_timer >= 3:
+        message = ""
+        refresh_message()
 
 def draw_message():
     if message and time.time() - message_timer < 3:
-        text = font.render(message, True, BLACK)
-        screen.blit(text, (WIDTH - 300, HEIGHT - 40))
+        text = texts.render(message, font, BLACK)
+        screen.blit(text, MESSAGE_RECT.topleft)
 
 def reset_game():
-    global nums
-    nums = [1, 0, 1, 0, 0, 0]
+    circle.reset()
 
-def draw_intro():
+def update_intro():
+    """
+    Advance the intro, returns whether it is still showing
+    """
     global intro_phase, intro_start_time
-    elapsed = time.time() - intro_start_time
+    if intro_phase < 2 and time.time() - intro_start_time >= 2.5:
+        intro_phase += 1
+        intro_start_time = time.time()
+        display.invalidate()
+    return intro_phase < 2
 
+def draw_intro():
     if intro_phase == 0:
-        if elapsed < 2.5:
-            screen.blit(intro_image, (0, 0))
-            return True
-        else:
-            intro_phase = 1
-            intro_start_time = time.time()
-            return True
-
-    elif intro_phase == 1:
-        if elapsed < 2.5:
-            screen.fill(BLACK)
-            title = big_font.render("The Magic Circle", True, WHITE)
-            title_rect = title.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            screen.blit(title, title_rect)
-            return True
-        else:
-            intro_phase = 2
-            return False
-
-    return False
+        screen.blit(intro_image, (0, 0))
+    else:
+        screen.fill(BLACK)
+        title = texts.render("The Magic Circle", big_font, WHITE)
+        title_rect = title.get_rect(center=(WIDTH // 2, HEIGHT // 2))
+        screen.blit(title, title_rect)
 
 # Main loop
+assets.report()
 clock = pygame.time.Clock()
 running = True
 
 while running:
-    screen.fill(WHITE)
-
     if intro_shown:
-        intro_still = draw_intro()
-        if not intro_still:
-            intro_shown = False
+        intro_shown = update_intro()
     else:
-        draw_circle_sectors()
-        draw_buttons()
-        draw_message()
+        update_hover()
+        update_message()
+
+    if display.full:
+        screen.fill(WHITE)
+        if intro_shown:
+            draw_intro()
+        else:
+            draw_circle_sectors()
+            draw_buttons()
+            draw_message()
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -157,10 +230,10 @@ while running:
             pos = pygame.mouse.get_pos()
 
             if not intro_shown:
-                if center[0] - radius <= pos[0] <= center[0] + radius and \
-                   center[1] - radius <= pos[1] <= center[1] + radius:
-                    sector = get_sector_from_pos(pos)
+                sector = get_sector_from_pos(pos)
+                if sector is not None:
                     increase_neighbors(sector)
+                    draw_labels((sector, (sector + 1) % num_sectors))
 
                 if buttons["check"].collidepoint(pos):
                     result = "Yes" if all_equal() else "No"
@@ -168,13 +241,18 @@ while running:
 
                 elif buttons["invariant"].collidepoint(pos):
                     inv = compute_invariant()
-                    show_message(f"Invariant: {inv}")
+                    show_message(f"Invariant: {inv}" if inv is not None else "No invariant (odd)")
+
+                elif buttons["solve"].collidepoint(pos):
+                    counts = circle.plan()
+                    show_message(f"Solvable in {counts.sum()} moves" if counts is not None else "Unsolvable")
 
                 elif buttons["reset"].collidepoint(pos):
                     reset_game()
+                    draw_labels(range(num_sectors))
                     show_message("Game Reset")
 
-    pygame.display.flip()
+    display.present()
     clock.tick(60)
 
 pygame.quit()
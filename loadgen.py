@@ -0,0 +1,285 @@
+#!/usr/bin/python
+"""
+Load generator and latency benchmark for server.py.
+
+Simulates N clients grouped in rooms, each sending timestamped datagrams at
+a fixed rate, and reports relay throughput, end-to-end latency percentiles,
+packet loss and server CPU. Results are written as JSON so runs can be
+compared across versions.
+
+    python loadgen.py --spawn --clients 500 --rate 10 --output bench.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import time
+from client import AsyncClient
+import protocol
+
+# client index, message number, send time (time.monotonic is system-wide on Linux)
+STAMP = struct.Struct("!IId")
+MAX_SAMPLES = 200000
+
+
+class SimulatedClient(AsyncClient):
+
+    def __init__(self, stats, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats
+
+    def receive(self, data):
+        # Measure straight from the datagram, no queueing or lazy decoding
+        if data is None or not protocol.is_binary(data):
+            return
+        now = time.monotonic()
+        for data in protocol.unbatch(data):
+            payload = data[protocol.HEADER.size:protocol.HEADER.size + STAMP.size]
+            if len(payload) < STAMP.size:
+                continue
+            _, _, sent = STAMP.unpack(payload)
+            self.stats.record(now - sent)
+
+
+class Stats:
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.latencies = []
+
+    def record(self, latency):
+        self.received += 1
+        # Reservoir sampling keeps percentiles honest with bounded memory
+        if len(self.latencies) < MAX_SAMPLES:
+            self.latencies.append(latency)
+        else:
+            i = random.randrange(self.received)
+            if i < MAX_SAMPLES:
+                self.latencies[i] = latency
+
+
+async def run_clients(config, first, count):
+    stats = Stats()
+    clients = [
+        SimulatedClient(stats, config["host"], config["tcp"], config["udp"],
+                        room=f"bench-{(first + i) // config['room_size']}")
+        for i in range(count)
+    ]
+
+    # Bounded concurrency: a whole classroom connecting at once overflows small accept backlogs
+    gate = asyncio.Semaphore(config["concurrency"])
+
+    async def register(client):
+        async with gate:
+            await client.register()
+
+    t0 = time.monotonic()
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        await asyncio.gather(*(register(c) for c in clients))
+    registration = time.monotonic() - t0
+
+    padding = b"x" * max(0, config["payload"] - STAMP.size)
+    interval = 1.0 / config["rate"]
+    deadline = time.monotonic() + config["duration"]
+
+    async def drive(index, client):
+        await asyncio.sleep(random.uniform(0, interval))
+        n = 0
+        next_send = time.monotonic()
+        while next_send < deadline:
+            await client.send(STAMP.pack(first + index, n, time.monotonic()) + padding)
+            stats.sent += 1
+            n += 1
+            next_send += interval
+            await asyncio.sleep(max(0, next_send - time.monotonic()))
+
+    await asyncio.gather(*(drive(i, c) for i, c in enumerate(clients)))
+    # Let in-flight datagrams land before counting losses
+    await asyncio.sleep(config["drain"])
+    for client in clients:
+        client.close()
+    return {
+        "sent": stats.sent,
+        "received": stats.received,
+        "latencies": stats.latencies,
+        "registration": registration
+    }
+
+
+def worker(args):
+    config, first, count = args
+    return asyncio.run(run_clients(config, first, count))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def stat_fields(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().rsplit(")", 1)[1].split()
+
+
+def process_tree(pid):
+    """
+    A process and its descendants, such as the relay workers of --workers
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                children.setdefault(int(stat_fields(entry)[1]), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    tree, pending = [], [pid]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def cpu_seconds(pid):
+    """
+    User + system CPU time of a process and its descendants, None where
+    /proc is unavailable
+    """
+    try:
+        ticks = 0
+        for process in process_tree(pid):
+            try:
+                fields = stat_fields(process)
+            except OSError:
+                # Exited since the listing
+                continue
+            ticks += int(fields[11]) + int(fields[12])
+        return ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game server load generator")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host")
+    parser.add_argument("--tcp", type=int, default=12345, help="Server TCP port")
+    parser.add_argument("--udp", type=int, default=54321, help="Server UDP port")
+    parser.add_argument("--spawn", action="store_true", help="Start a local server for the run")
+    parser.add_argument("--engine", choices=["thread", "asyncio"], default="thread",
+                        help="Engine of the spawned server")
+    parser.add_argument("--coalesce", type=float, default=0,
+                        help="Outbound batching interval of the spawned server (0: off)")
+    parser.add_argument("--workers", type=int, default=1, help="Relay processes of the spawned server")
+    parser.add_argument("--server-pid", type=int, help="Measure CPU of an already running server")
+    parser.add_argument("--clients", type=int, default=100, help="Simulated clients")
+    parser.add_argument("--processes", type=int, default=1, help="Processes sharing the clients")
+    parser.add_argument("--room-size", type=int, default=4, help="Clients per room")
+    parser.add_argument("--rate", type=float, default=10, help="Messages per second per client")
+    parser.add_argument("--payload", type=int, default=64, help="Payload bytes per message")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of sending")
+    parser.add_argument("--drain", type=float, default=1, help="Seconds to wait for late datagrams")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent registrations")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    server = None
+    server_pid = args.server_pid
+    if args.spawn:
+        server = subprocess.Popen(
+            [sys.executable, "server.py", "--tcp", str(args.tcp), "--udp", str(args.udp), "--engine", args.engine,
+             "--coalesce", str(args.coalesce), "--workers", str(args.workers)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL)
+        server_pid = server.pid
+        time.sleep(1)
+
+    config = {
+        "host": args.host, "tcp": args.tcp, "udp": args.udp,
+        "room_size": args.room_size, "rate": args.rate, "payload": args.payload,
+        "duration": args.duration, "drain": args.drain, "concurrency": args.concurrency
+    }
+    processes = max(1, min(args.processes, args.clients))
+    share, extra = divmod(args.clients, processes)
+    jobs, first = [], 0
+    for p in range(processes):
+        count = share + (1 if p < extra else 0)
+        jobs.append((config, first, count))
+        first += count
+
+    try:
+        cpu_before = cpu_seconds(server_pid) if server_pid else None
+        t0 = time.monotonic()
+        if processes == 1:
+            results = [worker(jobs[0])]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(worker, jobs)
+        elapsed = time.monotonic() - t0
+        cpu_after = cpu_seconds(server_pid) if server_pid else None
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    sent = sum(r["sent"] for r in results)
+    received = sum(r["received"] for r in results)
+    # Each message is relayed to the other members of its room
+    full_rooms, rest = divmod(args.clients, args.room_size)
+    members = [args.room_size] * full_rooms + ([rest] if rest else [])
+    expected = sent * sum(m * (m - 1) for m in members) / max(1, sum(members))
+    latencies = sorted(x for r in results for x in r["latencies"])
+    send_window = args.duration
+
+    report = {
+        "version": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": dict(config, clients=args.clients, processes=processes,
+                       engine=args.engine if args.spawn else None,
+                       coalesce=args.coalesce if args.spawn else None,
+                       workers=args.workers if args.spawn else None),
+        "sent": sent,
+        "received": received,
+        "expected": round(expected),
+        "loss": round(1 - received / expected, 6) if expected else None,
+        "sent_per_sec": round(sent / send_window, 1),
+        "relayed_per_sec": round(received / send_window, 1),
+        "registration_seconds": round(max(r["registration"] for r in results), 3),
+        "latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in (("p50", percentile(latencies, 50)),
+                                ("p95", percentile(latencies, 95)),
+                                ("p99", percentile(latencies, 99)),
+                                ("max", latencies[-1] if latencies else None))
+        },
+        "server_cpu": (round((cpu_after - cpu_before) / elapsed, 3)
+                       if cpu_before is not None and cpu_after is not None else None)
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
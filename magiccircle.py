@@ -0,0 +1,179 @@
+#!/usr/bin/python
+"""
+The Magic Circle without pygame: k sectors hold numbers, a move adds 1 to a
+sector and to the next one clockwise, the goal is to make them all equal.
+With an even k neighbours always have opposite signs in the alternating sum,
+so it never changes and must be 0 for the goal to be reachable.
+
+    python magiccircle.py 1 0 1 0 0 0
+    python magiccircle.py --random 24 --bfs
+"""
+
+import argparse
+import json
+import time
+from collections import namedtuple
+import numpy as np
+
+# reachable: True, False or None (search budget exhausted)
+Exploration = namedtuple("Exploration", ["reachable", "moves", "states", "reason"])
+
+
+def signs(sectors):
+    return np.where(np.arange(sectors) % 2 == 0, 1, -1)
+
+
+class MagicCircle:
+
+    def __init__(self, nums):
+        self.start = np.array(nums, dtype=np.int64)
+        self.nums = self.start.copy()
+
+    def __len__(self):
+        return len(self.nums)
+
+    def move(self, sector):
+        self.nums[sector] += 1
+        self.nums[(sector + 1) % len(self.nums)] += 1
+
+    def reset(self):
+        self.nums = self.start.copy()
+
+    def all_equal(self):
+        return bool((self.nums == self.nums[0]).all())
+
+    def invariant(self):
+        """
+        Alternating sum, None for an odd number of sectors where it isn't one
+        """
+        if len(self.nums) % 2:
+            return None
+        return int(signs(len(self.nums)) @ self.nums)
+
+    def plan(self):
+        return plan(self.nums)
+
+
+def plan(nums):
+    """
+    Fewest clicks per sector that make every sector equal, None when that is
+    impossible. Clicking c[j] times on j ends with nums[j] + c[j] + c[j-1] = t
+    for all j: fixing t and c[0] fixes every other c[j], so this only looks
+    for the smallest t (and c[0]) keeping all of them non-negative. The
+    clicks can be made in any order.
+    """
+    nums = np.asarray(nums, dtype=np.int64)
+    sectors = len(nums)
+    alternating = signs(sectors)
+    # c[j] = (-1)^j c[0] + base[j] + (t for odd j), with t = 0 in base
+    weighted = alternating * nums
+    base = -alternating * (np.cumsum(weighted) - weighted[0])
+    odd = np.arange(sectors) % 2 == 1
+    if sectors % 2 == 0:
+        if int(weighted.sum()):
+            return None
+        first = int(-base[~odd].min())
+        final = int((first - base[odd]).max())
+        counts = np.where(odd, base - first + final, base + first)
+    else:
+        # c[0] + c[k-1] = t - nums[0] fixes c[0] = (t - nums[0] - base[k-1]) / 2
+        shift = int(nums[0] + base[-1])
+        halves = np.where(odd, shift + 2 * base, 2 * base - shift)
+        final = int(-halves.min())
+        if (final - shift) % 2:
+            final += 1
+        counts = (final + halves) // 2
+    return counts
+
+
+def explore(nums, max_states=200000, spread=None):
+    """
+    Breadth-first search for the shortest sequence of moves. States are
+    shifted to a minimum of 0 (adding to every sector changes nothing) and
+    packed to bytes for the visited set, a whole level is expanded at once
+    with NumPy. States whose spread exceeds the bound (by default the
+    starting spread plus 2) are not explored.
+    """
+    circle = MagicCircle(nums)
+    sectors = len(circle)
+    invariant = circle.invariant()
+    if invariant:
+        return Exploration(False, None, 0, f"alternating sum is {invariant}, not 0")
+    start = circle.nums - circle.nums.min()
+    if not start.any():
+        return Exploration(True, [], 1, "already equal")
+    bound = int(start.max()) + 2 if spread is None else spread
+    moves = np.eye(sectors, dtype=np.int64) + np.roll(np.eye(sectors, dtype=np.int64), 1, axis=1)
+    parents = {start.tobytes(): None}
+    frontier = start[None, :]
+    while len(frontier):
+        children = (frontier[:, None, :] + moves[None, :, :]).reshape(-1, sectors)
+        children -= children.min(axis=1, keepdims=True)
+        origin = np.repeat(np.arange(len(frontier)), sectors)
+        clicked = np.tile(np.arange(sectors), len(frontier))
+        kept = children.max(axis=1) <= bound
+        children, origin, clicked = children[kept], origin[kept], clicked[kept]
+        following = []
+        for child, parent, sector in zip(children, origin, clicked):
+            key = child.tobytes()
+            if key in parents:
+                continue
+            parents[key] = (frontier[parent].tobytes(), int(sector))
+            if not child.any():
+                return Exploration(True, path(parents, key), len(parents), "found")
+            following.append(child)
+            if len(parents) >= max_states:
+                return Exploration(None, None, len(parents), f"gave up after {max_states} states")
+        frontier = np.array(following, dtype=np.int64).reshape(-1, sectors)
+    return Exploration(None, None, len(parents), f"nothing within a spread of {bound}")
+
+
+def path(parents, key):
+    moves = []
+    while parents[key] is not None:
+        key, sector = parents[key]
+        moves.append(sector)
+    return moves[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Can every sector of the Magic Circle be made equal?")
+    parser.add_argument("nums", type=int, nargs="*", help="Starting numbers, clockwise")
+    parser.add_argument("--random", type=int, metavar="SECTORS", help="Random start of this many sectors")
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument("--bfs", action="store_true", help="Also search the shortest sequence breadth-first")
+    parser.add_argument("--max-states", type=int, default=200000, help="Search budget of --bfs")
+    args = parser.parse_args()
+    if args.random:
+        nums = np.random.default_rng(args.seed).integers(0, 4, args.random).tolist()
+    elif args.nums:
+        nums = args.nums
+    else:
+        parser.error("Give the starting numbers or --random SECTORS")
+
+    circle = MagicCircle(nums)
+    started = time.perf_counter()
+    counts = circle.plan()
+    report = {
+        "nums": nums,
+        "invariant": circle.invariant(),
+        "reachable": counts is not None,
+        "clicks": counts.tolist() if counts is not None else None,
+        "moves": int(counts.sum()) if counts is not None else None,
+        "plan_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+    if args.bfs:
+        started = time.perf_counter()
+        found = explore(nums, args.max_states)
+        report["bfs"] = {
+            "reachable": found.reachable,
+            "moves": found.moves,
+            "states": found.states,
+            "reason": found.reason,
+            "ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import time
+from bisect import bisect_left
+from collections import Counter
+
+
+def escape(value):
+    # Room names come from clients
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+
+    # 1us .. ~8s in powers of two
+    BOUNDS = tuple(1e-6 * 2 ** i for i in range(24))
+
+    def __init__(self):
+        """
+        Fixed log2-bucket histogram, observe() is a bisect and three increments
+        """
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p-th percentile
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for bound, n in zip(self.BOUNDS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99)
+        }
+
+
+class Traffic:
+    __slots__ = ("packets_in", "bytes_in", "packets_out", "bytes_out")
+
+    def __init__(self):
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+
+
+class PlayerTraffic(Traffic):
+    __slots__ = ("room", "base_packets", "base_bytes", "own_packets", "own_bytes",
+                 "carried_packets", "carried_bytes")
+
+    def __init__(self, room, room_traffic):
+        """
+        Deliveries to a player are derived from its room's inbound totals
+        (everything the room relays except its own packets), so the relay
+        loop never does per-destination bookkeeping
+        """
+        super().__init__()
+        self.carried_packets = 0
+        self.carried_bytes = 0
+        self.join(room, room_traffic)
+
+    def join(self, room, room_traffic):
+        self.room = room
+        self.base_packets = room_traffic.packets_in
+        self.base_bytes = room_traffic.bytes_in
+        self.own_packets = self.packets_in
+        self.own_bytes = self.bytes_in
+
+    def move(self, room, old_traffic, room_traffic):
+        self.carried_packets, self.carried_bytes = self.delivered(old_traffic)
+        self.join(room, room_traffic)
+
+    def delivered(self, room_traffic):
+        return (self.carried_packets + room_traffic.packets_in - self.base_packets
+                - (self.packets_in - self.own_packets),
+                self.carried_bytes + room_traffic.bytes_in - self.base_bytes
+                - (self.bytes_in - self.own_bytes))
+
+
+class Metrics:
+
+    def __init__(self):
+        """
+        Server counters and histograms, cheap enough to stay on in production
+        """
+        self.started = time.time()
+        self.players = {}
+        # Room names come from clients: a room's counters go away with its last player
+        self.rooms = {}
+        self.members = Counter()
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.unregistered = 0
+        self.forged = 0
+        self.malformed = 0
+        self.evictions = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.retransmits = 0
+        self.rate_limited = Counter()
+        self.fanout = Histogram()
+        self.lock_wait = Histogram()
+        self.lock_hold = Histogram()
+        self.registration = Histogram()
+        self.errors = Counter()
+
+    def room(self, room):
+        traffic = self.rooms.get(room)
+        if traffic is None:
+            traffic = self.rooms[room] = Traffic()
+        return traffic
+
+    def player_joined(self, identifier, room):
+        """
+        Start (or move) the per-player counters of a player
+        """
+        player = self.players.get(identifier)
+        if player is None:
+            self.players[identifier] = PlayerTraffic(room, self.room(room))
+            self.members[room] += 1
+        elif player.room != room:
+            previous = player.room
+            player.move(room, self.room(previous), self.room(room))
+            self.members[room] += 1
+            self.emptied(previous)
+
+    def player_left(self, identifier):
+        player = self.players.pop(identifier, None)
+        if player is not None:
+            self.emptied(player.room)
+
+    def emptied(self, room):
+        """
+        One player less in a room, forget the room with the last one
+        """
+        self.members[room] -= 1
+        if self.members[room] <= 0:
+            del self.members[room]
+            self.rooms.pop(room, None)
+
+    def relayed(self, identifier, room, size, sent, sent_bytes, elapsed):
+        """
+        Account one relayed datagram
+        """
+        self.packets_in += 1
+        self.bytes_in += size
+        self.packets_out += sent
+        self.bytes_out += sent_bytes
+        self.fanout.observe(elapsed)
+        traffic = self.rooms.get(room)
+        if traffic is not None:
+            # Not when the sender's room just emptied, it would never be pruned
+            traffic.packets_in += 1
+            traffic.bytes_in += size
+            traffic.packets_out += sent
+            traffic.bytes_out += sent_bytes
+        player = self.players.get(identifier)
+        if player is not None:
+            player.packets_in += 1
+            player.bytes_in += size
+
+    def limited(self, reason):
+        self.rate_limited[reason] += 1
+
+    # Plain counters a relay worker process reports to the coordinator, along with
+    # the room and player traffic and the fan-out histogram
+    SUMMED = ("packets_in", "bytes_in", "packets_out", "bytes_out", "unregistered", "forged", "malformed", "batches", "coalesced")
+
+    def totals(self):
+        totals = {name: getattr(self, name) for name in self.SUMMED}
+        totals["rate_limited"] = dict(self.rate_limited)
+        totals["errors"] = dict(self.errors)
+        totals["rooms"] = {room: (t.packets_in, t.bytes_in, t.packets_out, t.bytes_out)
+                           for room, t in list(self.rooms.items())}
+        totals["players"] = {identifier: (p.packets_in, p.bytes_in) for identifier, p in list(self.players.items())}
+        totals["fanout"] = (list(self.fanout.buckets), self.fanout.count, self.fanout.sum)
+        return totals
+
+    @staticmethod
+    def difference(totals, previous):
+        counters = {name: totals[name] - previous.get(name, 0) for name in Metrics.SUMMED}
+        for name in ("rate_limited", "errors"):
+            before = previous.get(name, {})
+            counters[name] = {k: n - before.get(k, 0) for k, n in totals[name].items() if n != before.get(k, 0)}
+        for name in ("rooms", "players"):
+            before = previous.get(name, {})
+            counters[name] = {}
+            for key, values in totals[name].items():
+                old = before.get(key)
+                if old is None or values[0] < old[0]:
+                    # A player who left and came back starts over from 0
+                    old = (0,) * len(values)
+                if values != old:
+                    counters[name][key] = tuple(n - o for n, o in zip(values, old))
+        buckets, count, total = totals["fanout"]
+        old_buckets, old_count, old_total = previous.get("fanout", ([0] * len(buckets), 0, 0.0))
+        counters["fanout"] = ([n - o for n, o in zip(buckets, old_buckets)], count - old_count, total - old_total)
+        return counters
+
+    def merge(self, counters):
+        """
+        Add the counters reported by a relay worker process
+        """
+        for name in self.SUMMED:
+            setattr(self, name, getattr(self, name) + counters[name])
+        self.rate_limited.update(counters["rate_limited"])
+        self.errors.update(counters["errors"])
+        for room, (packets_in, bytes_in, packets_out, bytes_out) in counters["rooms"].items():
+            traffic = self.rooms.get(room)
+            if traffic is None:
+                continue
+            traffic.packets_in += packets_in
+            traffic.bytes_in += bytes_in
+            traffic.packets_out += packets_out
+            traffic.bytes_out += bytes_out
+        for identifier, (packets_in, bytes_in) in counters["players"].items():
+            player = self.players.get(identifier)
+            if player is not None:
+                player.packets_in += packets_in
+                player.bytes_in += bytes_in
+        buckets, count, total = counters["fanout"]
+        for bucket, n in enumerate(buckets):
+            self.fanout.buckets[bucket] += n
+        self.fanout.count += count
+        self.fanout.sum += total
+
+    def error(self, kind):
+        self.errors[kind] += 1
+
+    def player_rows(self):
+        for identifier, player in list(self.players.items()):
+            traffic = self.rooms.get(player.room)
+            if traffic is None:
+                # Left while this was iterating
+                continue
+            packets_out, bytes_out = player.delivered(traffic)
+            yield identifier, player, packets_out, bytes_out
+
+    def as_dict(self):
+        """
+        JSON-friendly view, answered to the "stats" control action
+        """
+        return {
+            "uptime": time.time() - self.started,
+            "packets_in": self.packets_in,
+            "bytes_in": self.bytes_in,
+            "packets_out": self.packets_out,
+            "bytes_out": self.bytes_out,
+            "unregistered_packets": self.unregistered,
+            "forged_packets": self.forged,
+            "malformed_packets": self.malformed,
+            "evictions": self.evictions,
+            "batches": self.batches,
+            "coalesced_messages": self.coalesced,
+            "retransmits": self.retransmits,
+            "rate_limited": dict(self.rate_limited),
+            "errors": dict(self.errors),
+            "relay_fanout_seconds": self.fanout.as_dict(),
+            "lock_wait_seconds": self.lock_wait.as_dict(),
+            "lock_hold_seconds": self.lock_hold.as_dict(),
+            "registration_seconds": self.registration.as_dict(),
+            "rooms": {
+                room: {"packets_in": t.packets_in, "bytes_in": t.bytes_in,
+                       "packets_out": t.packets_out, "bytes_out": t.bytes_out}
+                for room, t in list(self.rooms.items())
+            },
+            "players": {
+                identifier: {"room": p.room, "packets_in": p.packets_in, "bytes_in": p.bytes_in,
+                             "packets_out": packets_out, "bytes_out": bytes_out}
+                for identifier, p, packets_out, bytes_out in self.player_rows()
+            }
+        }
+
+    def render(self):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name, kind, samples):
+            lines.append(f"# TYPE game_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+                lines.append(f"game_{name}{{{label_text}}} {value}" if label_text else f"game_{name} {value}")
+
+        def histogram(name, h):
+            lines.append(f"# TYPE game_{name} histogram")
+            cumulative = 0
+            for bound, n in zip(h.BOUNDS, h.buckets):
+                cumulative += n
+                lines.append(f'game_{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'game_{name}_bucket{{le="+Inf"}} {h.count}')
+            lines.append(f"game_{name}_sum {h.sum}")
+            lines.append(f"game_{name}_count {h.count}")
+
+        metric("uptime_seconds", "gauge", [((), time.time() - self.started)])
+        metric("players", "gauge", [((), len(self.players))])
+        metric("rooms", "gauge", [((), len(self.rooms))])
+        for direction in ("in", "out"):
+            for unit in ("packets", "bytes"):
+                attr = f"{unit}_{direction}"
+                metric(f"udp_{attr}_total", "counter", [((), getattr(self, attr))])
+                metric(f"room_{attr}_total", "counter",
+                       [((("room", room),), getattr(t, attr)) for room, t in list(self.rooms.items())])
+        rows = list(self.player_rows())
+        metric("player_packets_in_total", "counter",
+               [((("player", i), ("room", p.room)), p.packets_in) for i, p, _, _ in rows])
+        metric("player_bytes_in_total", "counter",
+               [((("player", i), ("room", p.room)), p.bytes_in) for i, p, _, _ in rows])
+        metric("player_packets_out_total", "counter",
+               [((("player", i), ("room", p.room)), packets) for i, p, packets, _ in rows])
+        metric("player_bytes_out_total", "counter",
+               [((("player", i), ("room", p.room)), size) for i, p, _, size in rows])
+        metric("unregistered_packets_total", "counter", [((), self.unregistered)])
+        metric("forged_packets_total", "counter", [((), self.forged)])
+        metric("malformed_packets_total", "counter", [((), self.malformed)])
+        metric("evictions_total", "counter", [((), self.evictions)])
+        metric("udp_batches_total", "counter", [((), self.batches)])
+        metric("udp_coalesced_messages_total", "counter", [((), self.coalesced)])
+        metric("reliable_retransmits_total", "counter", [((), self.retransmits)])
+        metric("rate_limited_packets_total", "counter",
+               [((("reason", reason),), n) for reason, n in sorted(self.rate_limited.items())])
+        metric("socket_errors_total", "counter", [((("kind", kind),), n) for kind, n in sorted(self.errors.items())])
+        histogram("relay_fanout_seconds", self.fanout)
+        histogram("lock_wait_seconds", self.lock_wait)
+        histogram("lock_hold_seconds", self.lock_hold)
+        histogram("registration_seconds", self.registration)
+        return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+
+    def __init__(self, lock, metrics):
+        """
+        Lock wrapper recording how long callers wait for it and hold it
+        """
+        self.lock = lock
+        self.metrics = metrics
+        self.acquired = 0.0
+
+    def __enter__(self):
+        t0 = time.perf_counter()
+        self.lock.acquire()
+        self.acquired = time.perf_counter()
+        self.metrics.lock_wait.observe(self.acquired - t0)
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self.acquired
+        self.lock.release()
+        self.metrics.lock_hold.observe(held)
@@ -0,0 +1,25 @@
+# The board is a bitmask of the matches still alive, bit i for match i and
+# bit 0 for the red one. A move takes 1 to MAX_TAKE matches, whoever takes
+# the red match wins.
+RED = 1
+MAX_TAKE = 3
+
+
+def is_legal(state, move, take=MAX_TAKE):
+    return move != 0 and move & state == move and bin(move).count("1") <= take
+
+
+def wins(state):
+    """
+    Whether the player to move wins with perfect play. Which matches are
+    alive doesn't matter, only whether the red one still is: then taking it
+    wins, so there is nothing to precompute.
+    """
+    return bool(state & RED)
+
+
+def best_move(state):
+    """
+    Winning move as a bitmask of the matches to take, 0 once the red match is gone
+    """
+    return RED if state & RED else 0
@@ -0,0 +1,70 @@
+import numpy as np
+import pygame
+
+CONFETTI_COLORS = [(255, 0, 0), (0, 255, 0), (0, 255, 255), (255, 255, 0), (255, 105, 180)]
+
+
+def stamp(color, size):
+    """
+    One pre-rendered particle, black is transparent
+    """
+    sprite = pygame.Surface((2 * size + 1, 2 * size + 1))
+    sprite.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+    pygame.draw.circle(sprite, color, (size, size), size)
+    if pygame.display.get_surface() is not None:
+        sprite = sprite.convert()
+    return sprite
+
+
+class Confetti:
+
+    def __init__(self, count, width, height, colors=CONFETTI_COLORS, sizes=(4, 8), speeds=(1, 3), seed=None):
+        """
+        Falling confetti, the state of every particle lives in NumPy arrays
+        and one update() moves them all. Particles fall in from above the
+        width x height area and start over above it once they left it.
+        """
+        self.width = width
+        self.height = height
+        self.speeds = speeds
+        self.random = np.random.default_rng(seed)
+        # One stamp per (color, size), a particle only keeps the index of its own
+        self.stamps = [stamp(color, size) for color in colors for size in range(sizes[0], sizes[1] + 1)]
+        self.offsets = np.array([size for _ in colors for size in range(sizes[0], sizes[1] + 1)], dtype=np.int32)
+        self.x = self.random.integers(0, width + 1, count).astype(np.float32)
+        self.y = self.random.integers(-height, 1, count).astype(np.float32)
+        self.speed = self.random.uniform(speeds[0], speeds[1], count).astype(np.float32)
+        self.kind = self.random.integers(0, len(self.stamps), count)
+        self.rects = []
+
+    def __len__(self):
+        return len(self.x)
+
+    def update(self, steps=1):
+        self.y += self.speed * steps
+        fallen = np.flatnonzero(self.y > self.height)
+        if len(fallen):
+            self.y[fallen] = self.random.integers(-self.height, 1, len(fallen))
+            self.x[fallen] = self.random.integers(0, self.width + 1, len(fallen))
+
+    def draw(self, surface):
+        """
+        Blit the particles in sight in one call, returns the rects drawn
+        """
+        offsets = self.offsets[self.kind]
+        left = self.x.astype(np.int32) - offsets
+        top = self.y.astype(np.int32) - offsets
+        visible = np.flatnonzero(top + 2 * offsets >= 0)
+        stamps = self.stamps
+        self.rects = surface.blits(
+            [(stamps[kind], (x, y)) for kind, x, y in
+             zip(self.kind[visible].tolist(), left[visible].tolist(), top[visible].tolist())])
+        return self.rects
+
+    def erase(self, surface, layer):
+        """
+        Repaint what the last draw() covered from a layer of the surface's size
+        """
+        rects, self.rects = self.rects, []
+        surface.blits([(layer, rect, rect) for rect in rects], doreturn=False)
+        return rects
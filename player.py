@@ -1,17 +1,25 @@
-import uuid
 import json
-import socket
+import time
+from threading import Lock
+import protocol
 
 
 class Player:
+    __slots__ = ("identifier", "addr", "session", "wire", "room", "seq", "last_seen", "channel")
 
-    def __init__(self, addr, udp_port):
+    def __init__(self, identifier, addr, session=0, wire=protocol.JSON, room=protocol.DEFAULT_ROOM):
         """
         Identify a remote player
         """
-        self.identifier = str(uuid.uuid4())
+        self.identifier = identifier
         self.addr = addr
-        self.udp_addr = (addr[0], int(udp_port))
+        self.session = session
+        self.wire = wire
+        self.room = room
+        self.seq = 0
+        self.last_seen = time.monotonic()
+        # Reliable ordered stream with the server, opened on first use
+        self.channel = None
 
     def send_tcp(self, success, data, sock):
         """
@@ -23,9 +31,64 @@ class Player:
         message = json.dumps({"success": success_string, "message": data})
         sock.send(message.encode())
 
-    def send_udp(self, player_identifier, message):
+    def send_udp(self, sender, message, sock):
         """
-        Send udp packet to player (game logic interaction)
+        Send udp packet to player (game logic interaction) through the
+        server socket, or an Outbox to coalesce it with other messages
         """
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.sendto(json.dumps({player_identifier: message}).encode(), self.udp_addr)
\ No newline at end of file
+        if self.wire == protocol.BINARY:
+            self.seq += 1
+            data = protocol.encode(protocol.MSG_DATA, sender.session, self.seq, protocol.encode_text(message))
+        else:
+            data = json.dumps({sender.identifier: message}).encode()
+        sock.sendto(data, self.addr)
+
+
+class Outbox:
+
+    def __init__(self, sendto, metrics=None, mtu=protocol.MTU):
+        """
+        Drop-in for socket.sendto that coalesces the small binary datagrams
+        bound to the same address into one MSG_BATCH datagram, sent once it
+        would outgrow the MTU or on flush(). JSON datagrams go out at once,
+        legacy clients can't split a batch.
+        """
+        self.send = sendto
+        self.metrics = metrics
+        self.mtu = mtu
+        self.pending = {}
+        self.lock = Lock()
+
+    def sendto(self, data, addr):
+        if not protocol.is_binary(data) or len(data) + protocol.HEADER.size > self.mtu:
+            self.send(data, addr)
+            return
+        full = None
+        with self.lock:
+            queued = self.pending.get(addr)
+            if queued is None:
+                queued = self.pending[addr] = [protocol.HEADER.size, []]
+            elif queued[0] + len(data) > self.mtu:
+                full = queued[1]
+                queued[0] = protocol.HEADER.size
+                queued[1] = []
+            queued[0] += len(data)
+            queued[1].append(data)
+        if full:
+            self.emit(full, addr)
+
+    def flush(self):
+        """
+        Send everything queued, returns the number of datagrams sent
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for addr, (_, datagrams) in pending.items():
+            self.emit(datagrams, addr)
+        return len(pending)
+
+    def emit(self, datagrams, addr):
+        if len(datagrams) > 1 and self.metrics is not None:
+            self.metrics.batches += 1
+            self.metrics.coalesced += len(datagrams)
+        self.send(protocol.batch(datagrams), addr)
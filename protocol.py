@@ -0,0 +1,201 @@
+import json
+import struct
+from collections import namedtuple
+
+# Binary datagram layout (network byte order):
+#   version (B) | message type (B) | session id (I) | sequence (I) | payload length (H) | payload
+# JSON datagrams always start with "{", which never collides with a version byte,
+# so both formats can share the same UDP port.
+VERSION = 1
+HEADER = struct.Struct("!BBIIH")
+
+MSG_DATA = 1
+MSG_INPUT = 2  # payload: JSON object of state changes
+MSG_STATE = 3  # seq: server tick, payload: JSON {"base": acknowledged tick, "state": changes}
+MSG_ACK = 4    # seq: acknowledged server tick
+MSG_HEARTBEAT = 5  # keeps an idle player registered, never relayed
+MSG_BATCH = 6      # payload: complete binary datagrams back to back
+MSG_RELIABLE = 7   # seq: stream sequence (0: ack only), payload: acks + a complete binary datagram
+
+JSON = "json"
+BINARY = "binary"
+
+# Coalesced datagrams stay below a conservative path MTU
+MTU = 1200
+
+# Room joined by clients that don't ask for one
+DEFAULT_ROOM = "lobby"
+
+Packet = namedtuple("Packet", ["version", "type", "session", "seq", "payload"])
+
+# TCP control channel: every JSON message is preceded by its length (network byte order).
+# Legacy one-shot requests start with "{" instead, which a length prefix never does.
+FRAME = struct.Struct("!I")
+MAX_FRAME = 1 << 20
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode(msg_type, session, seq, payload=b""):
+    """
+    Build a binary datagram
+    """
+    return HEADER.pack(VERSION, msg_type, session, seq & 0xFFFFFFFF, len(payload)) + payload
+
+
+def decode(data):
+    """
+    Parse a binary datagram into a Packet
+    """
+    if len(data) < HEADER.size:
+        raise ProtocolError("Truncated header")
+    version, msg_type, session, seq, length = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    payload = data[HEADER.size:HEADER.size + length]
+    if len(payload) != length:
+        raise ProtocolError("Truncated payload")
+    return Packet(version, msg_type, session, seq, payload)
+
+
+def frame(message):
+    """
+    Encode a control message with its length prefix
+    """
+    body = json.dumps(message).encode()
+    return FRAME.pack(len(body)) + body
+
+
+def split_frames(buffer):
+    """
+    Decode every complete control message of a receive buffer,
+    returns them with the leftover bytes of a partial frame. A frame
+    that isn't valid JSON comes out as None.
+    """
+    messages = []
+    offset = 0
+    while len(buffer) - offset >= FRAME.size:
+        (length,) = FRAME.unpack_from(buffer, offset)
+        if length > MAX_FRAME:
+            raise ProtocolError(f"Control frame too large ({length} bytes)")
+        end = offset + FRAME.size + length
+        if end > len(buffer):
+            break
+        try:
+            messages.append(json.loads(buffer[offset + FRAME.size:end].decode()))
+        except ValueError:
+            messages.append(None)
+        offset = end
+    return messages, buffer[offset:]
+
+
+def is_binary(data):
+    """
+    Tell binary datagrams apart from legacy JSON ones
+    """
+    return len(data) > 0 and data[0] == VERSION
+
+
+def is_complete(data):
+    """
+    Tell whether a binary datagram is exactly as long as its header says
+    """
+    return len(data) >= HEADER.size and HEADER.size + int.from_bytes(data[10:12], "big") == len(data)
+
+
+def session_of(data):
+    """
+    Session id of a binary datagram, without decoding it
+    """
+    return int.from_bytes(data[2:6], "big")
+
+
+def is_reliable(data):
+    """
+    Tell datagrams of the reliable ordered channel apart
+    """
+    return len(data) > 1 and data[1] == MSG_RELIABLE and data[0] == VERSION
+
+
+def is_state(data):
+    """
+    Tell state updates of the tick-driven server apart from relayed messages
+    """
+    if is_binary(data):
+        return len(data) > 1 and data[1] == MSG_STATE
+    return data.startswith(b'{"tick"')
+
+
+def is_server_only(data):
+    """
+    Tell apart the datagrams a client may not send to its peers: state
+    updates, acks and batches only ever travel between server and client
+    """
+    if is_binary(data):
+        return len(data) > 1 and data[1] in (MSG_STATE, MSG_ACK, MSG_BATCH)
+    return data.startswith(b'{"tick"')
+
+
+def is_heartbeat(data):
+    """
+    Tell keep-alive datagrams apart, they refresh the sender and are dropped
+    """
+    if is_binary(data):
+        return len(data) > 1 and data[1] == MSG_HEARTBEAT
+    return data.startswith(b'{"heartbeat"')
+
+
+def batch(datagrams):
+    """
+    Pack several binary datagrams for the same destination into one
+    """
+    if len(datagrams) == 1:
+        return datagrams[0]
+    return encode(MSG_BATCH, 0, len(datagrams), b"".join(datagrams))
+
+
+def unbatch(data):
+    """
+    The datagrams carried by a received datagram, itself unless it is a batch
+    """
+    if not is_binary(data) or len(data) < 2 or data[1] != MSG_BATCH:
+        return [data]
+    payload = decode(data).payload
+    datagrams = []
+    offset = 0
+    while offset + HEADER.size <= len(payload):
+        end = offset + HEADER.size + HEADER.unpack_from(payload, offset)[4]
+        datagrams.append(payload[offset:end])
+        offset = end
+    return datagrams
+
+
+def encode_text(message):
+    """
+    Payload bytes for a message coming from the JSON world
+    """
+    if isinstance(message, bytes):
+        return message
+    if not isinstance(message, str):
+        message = json.dumps(message)
+    return message.encode()
+
+
+def to_json(packet, identifier):
+    """
+    Convert a binary data packet for a JSON client
+    """
+    return json.dumps({
+        "identifier": identifier,
+        "message": packet.payload.decode(errors="replace")
+    }).encode()
+
+
+def from_json(data, session):
+    """
+    Convert a JSON datagram for a binary client
+    """
+    message = json.loads(data.decode())
+    return encode(MSG_DATA, session, 0, encode_text(message.get("message", "")))
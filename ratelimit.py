@@ -0,0 +1,121 @@
+from collections import namedtuple
+from threading import Lock
+
+# Sustained rates per sender, 0 leaves that dimension unlimited
+Limit = namedtuple("Limit", ["packets", "bytes"])
+
+UNLIMITED = Limit(0, 0)
+
+# Why a packet was dropped: over the limit, over it once too often (the
+# sender gets blocked), or sent while blocked
+LIMITED = "limited"
+BLOCK = "block"
+BLOCKED = "blocked"
+
+
+def parse_limit(text):
+    """
+    "packets:bytes" per second, as given on the command line
+    """
+    packets, _, size = text.partition(":")
+    return Limit(float(packets or 0), float(size or 0))
+
+
+def parse_room_limit(text):
+    """
+    "room=packets:bytes", as given on the command line
+    """
+    room, separator, limit = text.rpartition("=")
+    if not separator or not room:
+        raise ValueError(f"Expected room=packets:bytes, got {text!r}")
+    return room, parse_limit(limit)
+
+
+class Bucket:
+    __slots__ = ("packets", "bytes", "stamp", "strikes", "strike_stamp", "blocked_until")
+
+    def __init__(self, limit, burst, now):
+        self.packets = max(1.0, limit.packets * burst)
+        self.bytes = limit.bytes * burst
+        self.stamp = now
+        self.strikes = 0.0
+        self.strike_stamp = now
+        self.blocked_until = 0.0
+
+
+class RateLimiter:
+
+    def __init__(self, default=UNLIMITED, rooms=None, burst=1.0, tolerance=100, forgiveness=10.0, block=10.0):
+        """
+        Per-sender token buckets checked before the fan-out. A bucket holds
+        burst seconds worth of the room's rates and refills lazily on the
+        next packet. Every dropped packet is a strike, strikes fade at
+        forgiveness per second, more than tolerance of them blocks the
+        sender for block seconds (0: never block). The relay path and the
+        control connections share the limiter, its own lock keeps the buckets
+        consistent without touching the registry lock the relay never takes.
+        """
+        self.default = default
+        self.rooms = dict(rooms or {})
+        self.burst = burst
+        self.tolerance = tolerance
+        self.forgiveness = forgiveness
+        self.block = block
+        self.buckets = {}
+        self.lock = Lock()
+
+    def __getstate__(self):
+        # Handed to the --workers processes, each gets a lock of its own
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def allow(self, player, size, now):
+        """
+        Take one packet of size bytes from the player's bucket. Returns
+        True to relay it, otherwise why it is dropped.
+        """
+        limit = self.rooms.get(player.room, self.default)
+        if not limit.packets and not limit.bytes:
+            return True
+        with self.lock:
+            return self.take(player, limit, size, now)
+
+    def take(self, player, limit, size, now):
+        # Called with self.lock held
+        bucket = self.buckets.get(player.identifier)
+        if bucket is None:
+            bucket = self.buckets[player.identifier] = Bucket(limit, self.burst, now)
+        if bucket.blocked_until > now:
+            return BLOCKED
+        elapsed = now - bucket.stamp
+        bucket.stamp = now
+        if limit.packets:
+            bucket.packets = min(max(1.0, limit.packets * self.burst), bucket.packets + elapsed * limit.packets)
+        if limit.bytes:
+            bucket.bytes = min(limit.bytes * self.burst, bucket.bytes + elapsed * limit.bytes)
+        if (not limit.packets or bucket.packets >= 1) and (not limit.bytes or bucket.bytes >= size):
+            bucket.packets -= 1
+            bucket.bytes -= size
+            return True
+        bucket.strikes = max(0.0, bucket.strikes - (now - bucket.strike_stamp) * self.forgiveness) + 1
+        bucket.strike_stamp = now
+        if self.block and bucket.strikes > self.tolerance:
+            bucket.blocked_until = now + self.block
+            bucket.strikes = 0.0
+            return BLOCK
+        return LIMITED
+
+    def forget(self, identifier, now):
+        """
+        Drop the bucket of a player that left, unless it is blocked:
+        registering again must not lift a block
+        """
+        with self.lock:
+            bucket = self.buckets.get(identifier)
+            if bucket is not None and bucket.blocked_until <= now:
+                del self.buckets[identifier]
@@ -0,0 +1,93 @@
+import json
+import os
+import socket
+import struct
+import time
+from collections import deque
+from threading import Thread
+
+# Log layout: MAGIC, then records of
+#   time (d, epoch seconds) | kind (B) | IPv4 (4s) | port (H) | payload length (H) | payload
+MAGIC = b"GSREC\x01\r\n"
+RECORD = struct.Struct("!dB4sHH")
+
+DATAGRAM = 0  # payload: the datagram as received
+JOIN = 1      # payload: JSON {"identifier", "wire", "room"}, registration or room change
+LEAVE = 2     # payload: empty
+
+
+class Recorder(Thread):
+
+    def __init__(self, path, interval=0.2):
+        """
+        Append-only traffic log. The receive path only appends a tuple to a
+        deque, this thread packs and writes the records every interval seconds.
+        """
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.pending = deque()
+        self.records = 0
+        self.is_running = True
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab", buffering=1 << 16)
+        if fresh:
+            self.file.write(MAGIC)
+
+    def datagram(self, data, addr):
+        self.pending.append((time.time(), DATAGRAM, addr, data))
+
+    def joined(self, player):
+        payload = json.dumps({"identifier": player.identifier, "wire": player.wire, "room": player.room})
+        self.pending.append((time.time(), JOIN, player.addr, payload.encode()))
+
+    def left(self, player):
+        self.pending.append((time.time(), LEAVE, player.addr, b""))
+
+    def flush(self):
+        # append and popleft are atomic on a deque, records appended while
+        # this drains it are left for the next flush
+        pending = [self.pending.popleft() for _ in range(len(self.pending))]
+        if not pending:
+            return
+        pack = RECORD.pack
+        self.file.write(b"".join(
+            pack(stamp, kind, socket.inet_aton(addr[0]), addr[1], len(data)) + data
+            for stamp, kind, addr, data in pending))
+        self.file.flush()
+        self.records += len(pending)
+
+    def run(self):
+        while self.is_running:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[RECORD] Error: {e}")
+
+    def stop(self):
+        self.is_running = False
+        if self.is_alive():
+            # Its last flush must be over before the final one
+            self.join()
+        self.flush()
+        self.file.close()
+        print(f"[RECORD] {self.records} records written to {self.path}")
+
+
+def records(buffer):
+    """
+    Iterate (time, kind, addr, payload) over a log held in a bytes-like
+    object (typically an mmap), stops at a truncated trailing record
+    """
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a traffic recording")
+    offset = len(MAGIC)
+    end = len(buffer)
+    while offset + RECORD.size <= end:
+        stamp, kind, ip, port, length = RECORD.unpack_from(buffer, offset)
+        offset += RECORD.size
+        if offset + length > end:
+            break
+        yield stamp, kind, (socket.inet_ntoa(ip), port), buffer[offset:offset + length]
+        offset += length
@@ -0,0 +1,115 @@
+from collections import namedtuple
+from threading import Lock
+import protocol
+
+# Immutable views of the registry handed to the relay path.
+# Room: destination addresses of one room grouped by wire format
+# Snapshot: room id -> Room, identifier -> Player, UDP address -> Player
+Room = namedtuple("Room", ["binary", "json"])
+Snapshot = namedtuple("Snapshot", ["rooms", "players", "addrs"])
+
+EMPTY_ROOM = Room((), ())
+EMPTY = Snapshot({}, {}, {})
+
+
+class PlayerRegistry:
+
+    def __init__(self, lock=None):
+        """
+        Copy-on-write player registry: writers rebuild the snapshot under the
+        lock and swap it in with a single assignment, readers never lock
+        """
+        self.lock = lock or Lock()
+        self.players = {}
+        # UDP source address -> player, validates senders in O(1)
+        self.addrs = {}
+        # room -> identifier -> addr, split by wire format so publishing a room
+        # is a couple of C-level copies
+        self.binary = {}
+        self.json = {}
+        self.snapshot = EMPTY
+
+    def publish(self, *rooms):
+        # Called with self.lock held, only the rooms that changed are rebuilt
+        snapshot_rooms = dict(self.snapshot.rooms)
+        for room in rooms:
+            binary = self.binary.get(room, {})
+            json = self.json.get(room, {})
+            if binary or json:
+                snapshot_rooms[room] = Room(tuple(binary.values()), tuple(json.values()))
+            else:
+                snapshot_rooms.pop(room, None)
+                self.binary.pop(room, None)
+                self.json.pop(room, None)
+        self.snapshot = Snapshot(snapshot_rooms, dict(self.players), dict(self.addrs))
+
+    def register(self, player):
+        """
+        Add or replace a player, it joins player.room
+        """
+        with self.lock:
+            previous = self.unlink(player.identifier)
+            self.link(player)
+            if previous is not None and previous.room != player.room:
+                self.publish(previous.room, player.room)
+            else:
+                self.publish(player.room)
+
+    def unregister(self, identifier):
+        """
+        Remove a player, returns it or None if unknown
+        """
+        with self.lock:
+            player = self.unlink(identifier)
+            if player is not None:
+                self.publish(player.room)
+        return player
+
+    def move(self, identifier, room):
+        """
+        Move a registered player to another room, returns it or None if unknown
+        """
+        with self.lock:
+            player = self.unlink(identifier)
+            if player is None:
+                return None
+            previous = player.room
+            player.room = room
+            self.link(player)
+            self.publish(previous, room)
+        return player
+
+    def link(self, player):
+        # Called with self.lock held
+        self.players[player.identifier] = player
+        self.addrs[player.addr] = player
+        members = self.binary if player.wire == protocol.BINARY else self.json
+        members.setdefault(player.room, {})[player.identifier] = player.addr
+
+    def unlink(self, identifier):
+        # Called with self.lock held
+        player = self.players.pop(identifier, None)
+        if player is not None:
+            if self.addrs.get(player.addr) is player:
+                del self.addrs[player.addr]
+            self.binary.get(player.room, {}).pop(identifier, None)
+            self.json.get(player.room, {}).pop(identifier, None)
+        return player
+
+    def get(self, identifier):
+        return self.snapshot.players.get(identifier)
+
+    def at(self, addr):
+        """
+        The player registered for a UDP source address, None for strangers
+        """
+        return self.snapshot.addrs.get(addr)
+
+    def room(self, room):
+        return self.snapshot.rooms.get(room, EMPTY_ROOM)
+
+    def __len__(self):
+        return len(self.snapshot.players)
+
+    def __iter__(self):
+        return iter(self.snapshot.players.values())
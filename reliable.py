@@ -0,0 +1,204 @@
+import struct
+import time
+from collections import deque
+from threading import Lock
+import protocol
+
+# Every MSG_RELIABLE payload starts with the acknowledgements of the other
+# direction: the last sequence delivered in order, then a bitmap of the
+# sequences after it that already arrived (bit i: delivered + 2 + i)
+ACKS = struct.Struct("!II")
+
+WINDOW = 32     # datagrams in flight, also the receiver's reordering buffer
+POLL = 0.02     # retransmission timer granularity
+MIN_RTO = 0.1
+MAX_RTO = 4.0
+INITIAL_RTO = 0.5
+
+
+class ReliableChannel:
+
+    def __init__(self, session=0, window=WINDOW):
+        """
+        One end of a reliable, ordered stream sharing the UDP socket with the
+        unreliable traffic. Acks ride on every reliable datagram, lost ones are
+        retransmitted one by one after an RTT-based timeout (RFC 6298) and
+        duplicates are dropped. The payloads are complete binary datagrams.
+        """
+        self.session = session
+        self.window = min(window, WINDOW)
+        self.lock = Lock()
+        # Sending side
+        self.next_seq = 1
+        self.unacked = {}  # seq -> [datagram, last sent, retransmitted]
+        self.backlog = deque()
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_RTO
+        self.retransmits = 0
+        # Receiving side
+        self.delivered = 0
+        self.out_of_order = {}
+        self.ack_due = False
+        self.duplicates = 0
+
+    def packet(self, seq, datagram):
+        # Called with self.lock held
+        bits = 0
+        for received in self.out_of_order:
+            bits |= 1 << (received - self.delivered - 2)
+        self.ack_due = False
+        return protocol.encode(protocol.MSG_RELIABLE, self.session, seq,
+                               ACKS.pack(self.delivered, bits) + datagram)
+
+    def transmit(self, datagram, now):
+        # Called with self.lock held
+        seq = self.next_seq
+        self.next_seq += 1
+        self.unacked[seq] = [datagram, now, False]
+        return self.packet(seq, datagram)
+
+    def window_open(self):
+        oldest = min(self.unacked) if self.unacked else self.next_seq
+        return self.next_seq - oldest < self.window
+
+    def send(self, datagram, now=None):
+        """
+        Queue a datagram for reliable delivery, returns what to send right away
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.backlog or not self.window_open():
+                self.backlog.append(datagram)
+                return []
+            return [self.transmit(datagram, now)]
+
+    def receive(self, data, now=None):
+        """
+        Handle a MSG_RELIABLE datagram, returns the payloads now deliverable in order
+        """
+        now = time.monotonic() if now is None else now
+        packet = protocol.decode(data)
+        if len(packet.payload) < ACKS.size:
+            raise protocol.ProtocolError("Truncated acknowledgements")
+        ack, bits = ACKS.unpack_from(packet.payload)
+        delivered = []
+        with self.lock:
+            self.acknowledge(ack, bits, now)
+            seq = packet.seq
+            if seq == 0:
+                # Pure acknowledgement
+                return delivered
+            self.ack_due = True
+            if seq <= self.delivered or seq in self.out_of_order or seq > self.delivered + self.window:
+                # Already delivered, already buffered, or beyond the buffer: the sender will retry
+                self.duplicates += 1
+                return delivered
+            self.out_of_order[seq] = packet.payload[ACKS.size:]
+            while self.delivered + 1 in self.out_of_order:
+                self.delivered += 1
+                delivered.append(self.out_of_order.pop(self.delivered))
+        return delivered
+
+    def acknowledge(self, ack, bits, now):
+        # Called with self.lock held
+        for seq in list(self.unacked):
+            offset = seq - ack - 2
+            if seq <= ack or (0 <= offset < 32 and bits >> offset & 1):
+                datagram, sent, retransmitted = self.unacked.pop(seq)
+                # Karn: a retransmitted datagram's ack says nothing about the RTT
+                if not retransmitted:
+                    self.sample(now - sent)
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + max(POLL, 4 * self.rttvar)))
+
+    def poll(self, now=None):
+        """
+        Retransmissions, datagrams the window now lets through and a pure ack
+        if nothing else carried it, to be called every POLL seconds while active()
+        """
+        now = time.monotonic() if now is None else now
+        outbound = []
+        with self.lock:
+            expired = [seq for seq, (_, sent, _) in self.unacked.items() if now - sent >= self.rto]
+            for seq in expired:
+                entry = self.unacked[seq]
+                entry[1] = now
+                entry[2] = True
+                outbound.append(self.packet(seq, entry[0]))
+            if expired:
+                self.retransmits += len(expired)
+                self.rto = min(MAX_RTO, self.rto * 2)
+            while self.backlog and self.window_open():
+                outbound.append(self.transmit(self.backlog.popleft(), now))
+            if self.ack_due:
+                outbound.append(self.packet(0, b""))
+        return outbound
+
+    def active(self):
+        return bool(self.unacked or self.backlog or self.ack_due)
+
+
+class ReliableHub:
+
+    def __init__(self, registry, metrics=None):
+        """
+        Server end of the players' reliable channels, created on first use.
+        Only the channels with something in flight are polled.
+        """
+        self.registry = registry
+        self.metrics = metrics
+        self.active = {}
+
+    def channel(self, player):
+        if player.channel is None:
+            player.channel = ReliableChannel(player.session)
+        return player.channel
+
+    def receive(self, player, data):
+        """
+        Payloads a player's reliable datagram makes deliverable, in order
+        """
+        channel = self.channel(player)
+        delivered = channel.receive(data)
+        if channel.active():
+            self.active[player.addr] = player
+        return delivered
+
+    def send(self, player, datagram):
+        channel = self.channel(player)
+        outbound = channel.send(datagram)
+        self.active[player.addr] = player
+        return outbound
+
+    def poll(self, sendto):
+        """
+        Drive every active channel, returns the number of datagrams sent
+        """
+        now = time.monotonic()
+        sent = 0
+        for addr, player in list(self.active.items()):
+            # Left, evicted or registered again: the stream dies with the player
+            if self.registry.at(addr) is not player:
+                self.active.pop(addr, None)
+                continue
+            channel = player.channel
+            retransmits = channel.retransmits
+            for data in channel.poll(now):
+                sendto(data, addr)
+                sent += 1
+            if self.metrics is not None:
+                self.metrics.retransmits += channel.retransmits - retransmits
+            if not channel.active():
+                self.active.pop(addr, None)
+                # The relay may have just used it again
+                if channel.active():
+                    self.active[addr] = player
+        return sent
@@ -0,0 +1,86 @@
+import pygame
+from collections import OrderedDict
+
+# Past this many dirty rectangles a single flip is cheaper
+MAX_RECTS = 300
+
+
+class TextCache:
+
+    def __init__(self, capacity=512):
+        """
+        Rendered text surfaces by (text, font, color), the least recently
+        used ones are dropped past capacity. The surfaces are shared: blit
+        them, don't draw on them or change their alpha.
+        """
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, font, color, antialias=True):
+        key = (text, font, color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.surfaces[key] = font.render(text, antialias, color)
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+# Shared by every game
+texts = TextCache()
+
+
+def blit_text(surface, text, font, color, **position):
+    """
+    Blit cached text placed like get_rect(**position), returns the rect drawn
+    """
+    label = texts.render(text, font, color)
+    return surface.blit(label, label.get_rect(**position))
+
+
+class Display:
+
+    def __init__(self, surface):
+        """
+        Dirty rectangle bookkeeping for the display surface: present() pushes
+        the regions marked since the last frame, the whole screen after
+        invalidate(), and nothing at all when the frame didn't change.
+        """
+        self.surface = surface
+        self.rects = []
+        self.full = True
+
+    def invalidate(self):
+        self.full = True
+
+    def mark(self, rect):
+        if rect:
+            self.rects.append(pygame.Rect(rect))
+
+    def mark_many(self, rects):
+        self.rects.extend(rects)
+
+    def restore(self, layer, rect):
+        """
+        Repaint a region from a pre-rendered layer of the same size as the screen
+        """
+        rect = pygame.Rect(rect).clip(self.surface.get_rect())
+        if rect:
+            self.mark(self.surface.blit(layer, rect, rect))
+
+    def present(self):
+        if self.full or len(self.rects) > MAX_RECTS:
+            pygame.display.flip()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        else:
+            return False
+        self.full = False
+        self.rects = []
+        return True
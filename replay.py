@@ -0,0 +1,137 @@
+#!/usr/bin/python
+"""
+Replay a traffic log written by server.py --record against a server.
+
+Every recorded sender becomes a local client registered with the room and
+wire format it had, and its datagrams are re-sent with their original
+spacing (or faster). Binary datagrams get the session of the new client,
+otherwise the server would drop them as spoofed.
+
+    python server.py --record prod.rec
+    python replay.py prod.rec --speed 4 --output replay.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import mmap
+import os
+import time
+from client import AsyncClient
+from recorder import records, DATAGRAM, JOIN, LEAVE
+import protocol
+
+
+class ReplayClient(AsyncClient):
+
+    def __init__(self, counter, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = counter
+
+    def receive(self, data):
+        # Count what the server relays, don't queue it
+        if data is not None:
+            self.counter["received"] += 1
+
+
+def with_session(data, session):
+    if not protocol.is_binary(data) or len(data) < protocol.HEADER.size:
+        return data
+    return data[:2] + session.to_bytes(4, "big") + data[6:]
+
+
+async def replay(buffer, host, tcp, udp, speed, limit):
+    counter = {"received": 0}
+    clients = {}
+    sent = skipped = registrations = 0
+
+    async def client_for(addr, wire=protocol.BINARY, room=protocol.DEFAULT_ROOM):
+        nonlocal registrations
+        client = clients.get(addr)
+        if client is None:
+            client = clients[addr] = ReplayClient(counter, host, tcp, udp, wire=wire, room=room)
+            await client.register()
+            registrations += 1
+        return client
+
+    first = None
+    started = time.monotonic()
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        for stamp, kind, addr, payload in records(buffer):
+            if first is None:
+                first = stamp
+            if speed:
+                # Sleep only when well ahead, a burst of records goes out back to back
+                delay = started + (stamp - first) / speed - time.monotonic()
+                if delay > 0.001:
+                    await asyncio.sleep(delay)
+            if kind == JOIN:
+                info = json.loads(bytes(payload).decode())
+                client = clients.get(addr)
+                if client is None or client.identifier is None:
+                    clients.pop(addr, None)
+                    await client_for(addr, info["wire"], info["room"])
+                elif client.room != info["room"]:
+                    await client.join(info["room"])
+            elif kind == LEAVE:
+                client = clients.pop(addr, None)
+                if client is not None:
+                    await client.leave()
+                    client.close()
+            elif kind == DATAGRAM:
+                # Senders already registered when the recording started are registered on first sight
+                client = await client_for(addr, protocol.BINARY if protocol.is_binary(payload) else protocol.JSON)
+                if client.identifier is None:
+                    skipped += 1
+                    continue
+                client.transport.sendto(with_session(bytes(payload), client.session), (host, udp))
+                sent += 1
+                if limit and sent >= limit:
+                    break
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(0.5)
+        stats = None
+        if clients:
+            with contextlib.suppress(Exception):
+                stats = (await next(iter(clients.values())).request({"action": "stats"})).get("stats")
+    for client in clients.values():
+        client.close()
+    return {
+        "sent": sent,
+        "skipped": skipped,
+        "registrations": registrations,
+        "received": counter["received"],
+        "seconds": round(elapsed, 3),
+        "sent_per_sec": round(sent / elapsed, 1) if elapsed else None,
+        "recorded_seconds": round(stamp - first, 3) if first is not None else 0,
+        "server": {key: stats[key] for key in ("packets_in", "packets_out", "unregistered_packets", "rate_limited")
+                   if key in stats} if stats else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded game server traffic")
+    parser.add_argument("log", help="Traffic log written by server.py --record")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host")
+    parser.add_argument("--tcp", type=int, default=12345, help="Server TCP port")
+    parser.add_argument("--udp", type=int, default=54321, help="Server UDP port")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Time scale: 1 original pace, 4 four times faster, 0 as fast as possible")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after this many datagrams (0: all)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    with open(args.log, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        report = asyncio.run(replay(buffer, args.host, args.tcp, args.udp, args.speed, args.limit))
+    report["log"] = args.log
+    report["speed"] = args.speed
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,665 @@
 #!/usr/bin/python
 
 import argparse
+import asyncio
+import itertools
+import multiprocessing
 import socket
 import json
 import time
+from multiprocessing.connection import wait
 from threading import Thread, Lock
-from player import Player
+from metrics import Metrics, TimedLock
+from player import Player, Outbox
+from registry import PlayerRegistry, EMPTY_ROOM
+from reliable import ReliableHub, POLL
+from ratelimit import RateLimiter, UNLIMITED, BLOCK, parse_limit, parse_room_limit
+from recorder import Recorder
+from state import StateSync
+from timerwheel import TimerWheel
+import protocol
 
-class UdpServer(Thread):
-    def __init__(self, udp_port, lock):
+# What a player may carry on its reliable stream, peers get it as if it were relayed
+RELIABLE_PAYLOADS = (protocol.MSG_DATA, protocol.MSG_INPUT)
+
+
+def handle_request(message, addr, server, channel):
+    """
+    Process one TCP control request and return the response. channel holds
+    the state of the control connection: the player registered through it.
+    A bad request gets a failure response, the connection stays open.
+    """
+    if not isinstance(message, dict):
+        return {"success": False, "message": "Malformed request"}
+    try:
+        response = dispatch(message, addr, server, channel)
+    except Exception as e:
+        server.metrics.error("tcp_request")
+        response = {"success": False, "message": f"Bad request: {e}"}
+    if "id" in message:
+        response["id"] = message["id"]
+    return response
+
+
+def dispatch(message, addr, server, channel):
+    action = message.get("action")
+    payload = message.get("payload")
+    if action == "register":
+        started = time.perf_counter()
+        udp_port = int(payload)
+        identifier = f"{addr[0]}:{udp_port}"
+        # Clients that don't ask for the binary format keep talking JSON
+        wire = protocol.BINARY if message.get("protocol") == protocol.BINARY else protocol.JSON
+        room = str(message.get("room") or protocol.DEFAULT_ROOM)
+        if channel.get("identifier") not in (None, identifier):
+            server.unregister_player(channel["identifier"])
+        # Legacy one-shot clients never send heartbeats, they get the longer timeout
+        legacy = bool(channel.get("legacy"))
+        player = server.register_player(identifier, (addr[0], udp_port), wire, room, legacy)
+        channel["identifier"] = identifier
+        print(f"[TCP] Registered player {identifier} in room {room} ({wire})")
+        response = {
+            "success": True,
+            "identifier": identifier,
+            "session": player.session,
+            "protocol": wire,
+            "room": room,
+            "timeout": server.legacy_timeout if legacy else server.idle_timeout
+        }
+        server.metrics.registration.observe(time.perf_counter() - started)
+        return response
+    identifier = channel.get("identifier")
+    if identifier is not None:
+        # Control traffic counts as a sign of life
+        server.touch(identifier)
+    if action == "ping":
+        return {"success": True, "payload": payload, "time": time.time()}
+    if action == "stats":
+        return {"success": True, "stats": server.metrics.as_dict()}
+    if action in ("leave", "join") and identifier is None:
+        return {"success": False, "message": "Not registered"}
+    if action == "leave":
+        server.unregister_player(identifier)
+        channel["identifier"] = None
+        print(f"[TCP] Player {identifier} left")
+        return {"success": True}
+    if action == "join":
+        room = str(payload or protocol.DEFAULT_ROOM)
+        if server.move_player(identifier, room) is None:
+            # Evicted while idle, the client has to register again
+            channel["identifier"] = None
+            return {"success": False, "message": "Not registered"}
+        print(f"[TCP] Player {identifier} joined room {room}")
+        return {"success": True, "room": room}
+    return {"success": False, "message": "Unknown action"}
+
+
+def convert(data, binary, identifier, sender):
+    """
+    Translate a datagram to the other wire format, None if it can't be parsed
+    """
+    try:
+        if binary:
+            return protocol.to_json(protocol.decode(data), identifier)
+        return protocol.from_json(data, sender.session if sender else 0)
+    except ValueError:
+        return None
+
+
+def relay(data, addr, snapshot, sendto, metrics=None, reliable=None, limiter=None):
+    """
+    Forward a datagram to the other players of the sender's room, converting
+    it at most once for the players that negotiated the other wire format.
+    Datagrams from unregistered addresses, truncated or carrying another
+    session, are dropped before the fan-out, as are the ones only the server may send
+    (state, acks, batches) and the ones over the sender's rate limit.
+    Returns the number of datagrams sent.
+    """
+    started = time.perf_counter() if metrics is not None else 0
+    sender = snapshot.addrs.get(addr)
+    binary = protocol.is_binary(data)
+    if binary and not protocol.is_complete(data):
+        if metrics is not None:
+            metrics.malformed += 1
+        return 0
+    if sender is None or (binary and protocol.session_of(data) != sender.session):
+        if metrics is not None:
+            metrics.unregistered += 1
+        return 0
+    now = time.monotonic()
+    sender.last_seen = now
+    if protocol.is_heartbeat(data):
+        return 0
+    if protocol.is_server_only(data):
+        if metrics is not None:
+            metrics.forged += 1
+        return 0
+    if limiter is not None:
+        verdict = limiter.allow(sender, len(data), now)
+        if verdict is not True:
+            if metrics is not None:
+                metrics.limited(verdict)
+            if verdict == BLOCK:
+                print(f"[UDP] Blocked player {sender.identifier} for {limiter.block:g}s (flooding)")
+            return 0
+    if binary and reliable is not None and protocol.is_reliable(data):
+        return relay_reliable(data, sender, snapshot, sendto, metrics, reliable, started)
+    identifier = sender.identifier
+    room_id = sender.room
+    room = snapshot.rooms.get(room_id, EMPTY_ROOM)
+    if binary:
+        same, other = room.binary, room.json
+    else:
+        same, other = room.json, room.binary
+    sent = 0
+    for dest in same:
+        if dest != addr:
+            sendto(data, dest)
+            sent += 1
+    sent_bytes = sent * len(data)
+    if other:
+        converted = convert(data, binary, identifier, sender)
+        if converted:
+            for dest in other:
+                if dest != addr:
+                    sendto(converted, dest)
+                    sent += 1
+                    sent_bytes += len(converted)
+    if metrics is not None:
+        metrics.relayed(identifier, room_id, len(data), sent, sent_bytes, time.perf_counter() - started)
+    return sent
+
+
+def relay_reliable(data, sender, snapshot, sendto, metrics, reliable, started):
+    """
+    Reliable datagrams are acknowledged hop by hop: the sender's stream hands
+    over the payloads in order, exactly once, and each of them goes out on the
+    stream of every binary peer. JSON peers can't ack, they get a plain copy.
+    Payloads of another session or type than a relayed message are dropped.
+    """
+    sent = sent_bytes = received = 0
+    room = snapshot.rooms.get(sender.room, EMPTY_ROOM)
+    for payload in reliable.receive(sender, data):
+        if (not protocol.is_binary(payload) or len(payload) < protocol.HEADER.size
+                or payload[1] not in RELIABLE_PAYLOADS or protocol.session_of(payload) != sender.session):
+            if metrics is not None:
+                metrics.forged += 1
+            continue
+        received += len(payload)
+        for dest in room.binary:
+            peer = snapshot.addrs.get(dest)
+            if dest != sender.addr and peer is not None:
+                for datagram in reliable.send(peer, payload):
+                    sendto(datagram, dest)
+                    sent_bytes += len(datagram)
+                sent += 1
+        if room.json:
+            converted = convert(payload, True, sender.identifier, sender)
+            if converted:
+                for dest in room.json:
+                    sendto(converted, dest)
+                    sent += 1
+                    sent_bytes += len(converted)
+    if metrics is not None and received:
+        metrics.relayed(sender.identifier, sender.room, received, sent, sent_bytes, time.perf_counter() - started)
+    return sent
+
+
+class Liveness:
+
+    def __init__(self, server, timeout, legacy_timeout=0):
+        """
+        Idle-player eviction. Packets only stamp player.last_seen; each player
+        has one timer in a hashed wheel and an expired timer either evicts the
+        player or is re-armed from its last_seen, so nothing ever scans all players.
+        Legacy one-shot registrations can't send heartbeats and get their own,
+        longer timeout. A timeout of 0 never evicts.
+        """
+        self.server = server
+        self.timeout = timeout
+        self.legacy_timeout = legacy_timeout
+        self.legacy = set()
+        shortest = min(t for t in (timeout, legacy_timeout) if t)
+        self.wheel = TimerWheel(resolution=min(1.0, shortest / 4))
+
+    def timeout_of(self, identifier):
+        return self.legacy_timeout if identifier in self.legacy else self.timeout
+
+    def watch(self, player, legacy=False):
+        player.last_seen = time.monotonic()
+        if legacy:
+            self.legacy.add(player.identifier)
+        else:
+            self.legacy.discard(player.identifier)
+        timeout = self.timeout_of(player.identifier)
+        if timeout:
+            self.wheel.schedule(player.identifier, timeout, player.last_seen)
+        else:
+            # Drops the timer of an earlier registration under the same identifier
+            self.wheel.cancel(player.identifier)
+
+    def forget(self, identifier):
+        self.legacy.discard(identifier)
+        self.wheel.cancel(identifier)
+
+    def sweep(self):
+        """
+        Evict the players idle for longer than the timeout, returns how many
+        """
+        now = time.monotonic()
+        evicted = 0
+        for identifier in self.wheel.advance(now):
+            player = self.server.registry.get(identifier)
+            if player is None:
+                continue
+            timeout = self.timeout_of(identifier)
+            if not timeout:
+                continue
+            idle = now - player.last_seen
+            if idle < timeout:
+                self.wheel.schedule(identifier, timeout - idle, now)
+                continue
+            self.server.unregister_player(identifier)
+            self.server.metrics.evictions += 1
+            evicted += 1
+            print(f"[UDP] Evicted player {identifier} (idle {idle:.0f}s)")
+        return evicted
+
+
+class PlayerSessions:
+    """
+    Player bookkeeping shared by the thread and asyncio engines
+    """
+
+    def setup(self, metrics, lock, tick_rate, idle_timeout, coalesce, limiter, recorder, legacy_timeout):
+        self.metrics = metrics
+        self.registry = PlayerRegistry(lock)
+        self.sessions = itertools.count(1)
+        self.sync = StateSync(self.registry, tick_rate) if tick_rate else None
+        self.idle_timeout = idle_timeout
+        self.legacy_timeout = legacy_timeout
+        self.liveness = Liveness(self, idle_timeout, legacy_timeout) if idle_timeout or legacy_timeout else None
+        self.coalesce = coalesce
+        self.reliable = ReliableHub(self.registry, self.metrics)
+        self.limiter = limiter
+        self.recorder = recorder
+
+    def register_player(self, identifier, addr, wire=protocol.JSON, room=protocol.DEFAULT_ROOM, legacy=False):
+        player = Player(identifier, addr, next(self.sessions), wire, room)
+        self.registry.register(player)
+        self.metrics.player_joined(identifier, room)
+        if self.sync:
+            self.sync.reset(identifier)
+        if self.liveness:
+            self.liveness.watch(player, legacy)
+        if self.recorder:
+            self.recorder.joined(player)
+        return player
+
+    def unregister_player(self, identifier):
+        self.metrics.player_left(identifier)
+        if self.liveness:
+            self.liveness.forget(identifier)
+        if self.limiter:
+            self.limiter.forget(identifier, time.monotonic())
+        player = self.registry.unregister(identifier)
+        if player is not None and self.recorder:
+            self.recorder.left(player)
+        return player
+
+    def touch(self, identifier):
+        player = self.registry.get(identifier)
+        if player is not None:
+            player.last_seen = time.monotonic()
+
+    def chores(self):
+        """
+        (interval, callable, tag) of the periodic jobs this configuration needs
+        """
+        chores = [(POLL, lambda: self.reliable.poll(self.sendto), "RELIABLE")]
+        if self.outbox:
+            chores.append((self.coalesce, self.outbox.flush, "FLUSH"))
+        if self.liveness:
+            chores.append((self.liveness.wheel.resolution, self.liveness.sweep, "REAPER"))
+        return chores
+
+    def move_player(self, identifier, room):
+        player = self.registry.move(identifier, room)
+        if player is not None:
+            self.metrics.player_joined(identifier, room)
+            if self.sync:
+                self.sync.reset(identifier)
+            if self.recorder:
+                self.recorder.joined(player)
+        return player
+
+
+class ControlConnection:
+
+    def __init__(self, server, addr):
+        """
+        Requests and responses of one TCP control connection, the engine
+        does the reading and writing. The first bytes tell a legacy client
+        (one unframed request, then the connection closes) from a
+        persistent channel of pipelined length-prefixed requests.
+        """
+        self.server = server
+        self.addr = addr
+        self.channel = {"identifier": None}
+        self.buffer = None
+        self.done = False
+
+    def receive(self, data):
+        """
+        Bytes to send back for the data just received, done is set once the
+        connection should be closed
+        """
+        if self.buffer is None and data.startswith(b"{"):
+            self.done = True
+            self.channel["legacy"] = True
+            response = handle_request(json.loads(data.decode()), self.addr, self.server, self.channel)
+            self.channel["identifier"] = None
+            return json.dumps(response).encode()
+        self.buffer = (self.buffer or b"") + data
+        messages, self.buffer = protocol.split_frames(self.buffer)
+        return b"".join(protocol.frame(handle_request(message, self.addr, self.server, self.channel))
+                        for message in messages)
+
+    def close(self):
+        # Closing the control channel ends the session
+        identifier = self.channel["identifier"]
+        if identifier:
+            self.server.unregister_player(identifier)
+            print(f"[TCP] Player {identifier} disconnected")
+
+
+class Periodic(Thread):
+    def __init__(self, interval, work, metrics, tag):
+        """
+        Background chore of the threaded engine (eviction, flushing, retransmission)
+        """
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.work = work
+        self.metrics = metrics
+        self.tag = tag
+        self.is_running = True
+
+    def run(self):
+        while self.is_running:
+            time.sleep(self.interval)
+            try:
+                self.work()
+            except Exception as e:
+                if self.is_running:
+                    self.metrics.error(self.tag.lower())
+                    print(f"[{self.tag}] Error: {e}")
+
+    def stop(self):
+        self.is_running = False
+
+
+class UdpServer(PlayerSessions, Thread):
+    def __init__(self, udp_port, lock, tick_rate=0, metrics=None, idle_timeout=0, coalesce=0, limiter=None,
+                 recorder=None, reuse_port=False, legacy_timeout=0):
         super().__init__()
         self.udp_port = udp_port
-        self.lock = lock
-        self.players = {}
+        # Registrations serialise on the shared lock, the relay loop never takes it
+        self.setup(metrics or Metrics(), lock, tick_rate, idle_timeout, coalesce, limiter, recorder, legacy_timeout)
         self.is_running = True
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            # The kernel spreads senders over every socket bound to the port
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind(("", udp_port))
+        # Every outbound datagram goes through the one server socket, batched when coalescing
+        self.outbox = Outbox(self.sock.sendto, self.metrics) if coalesce else None
+        self.sendto = self.outbox.sendto if self.outbox else self.sock.sendto
 
     def run(self):
         print(f"[UDP] Server listening on port {self.udp_port}")
         while self.is_running:
             try:
-                data, addr = self.sock.recvfrom(1024)
-                with self.lock:
-                    for pid, player in self.players.items():
-                        if player.addr != addr:
-                            self.sock.sendto(data, player.addr)
+                data, addr = self.sock.recvfrom(65535)
+                if not self.is_running:
+                    # Woken up by stop()
+                    break
+                self.handle(data, addr)
             except Exception as e:
                 if self.is_running:
+                    self.metrics.error("udp")
                     print(f"[UDP] Error: {e}")
 
-    def register_player(self, identifier, addr):
-        with self.lock:
-            self.players[identifier] = Player(identifier, addr)
+    def handle(self, data, addr):
+        if self.recorder:
+            self.recorder.datagram(data, addr)
+        if self.sync is None or not self.sync.receive(data, addr):
+            relay(data, addr, self.registry.snapshot, self.sendto, self.metrics, self.reliable, self.limiter)
 
     def send(self, identifier, message, sock):
-        with self.lock:
-            for pid, player in self.players.items():
-                if pid != identifier:
-                    sock.sendto(message.encode(), player.addr)
+        sender = self.registry.get(identifier)
+        room = self.registry.room(sender.room if sender else protocol.DEFAULT_ROOM)
+        for addr in room.binary + room.json:
+            if sender is None or addr != sender.addr:
+                sock.sendto(message.encode(), addr)
 
     def stop(self):
         self.is_running = False
+        try:
+            # Wakes up the recvfrom of the relay loop, close() alone doesn't
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
         print("[UDP] Server stopped")
 
 
+class Ticker(Thread):
+    def __init__(self, sync, sendto, metrics, outbox=None):
+        super().__init__()
+        self.sync = sync
+        self.sendto = sendto
+        self.metrics = metrics
+        self.outbox = outbox
+        self.is_running = True
+
+    def run(self):
+        print(f"[TICK] State sync at {1 / self.sync.interval:g} Hz")
+        next_tick = time.monotonic()
+        while self.is_running:
+            next_tick += self.sync.interval
+            try:
+                self.sync.tick(self.sendto)
+                if self.outbox:
+                    # State deltas leave together with the messages relayed since the last flush
+                    self.outbox.flush()
+            except Exception as e:
+                if self.is_running:
+                    self.metrics.error("tick")
+                    print(f"[TICK] Error: {e}")
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Running late: skip the missed ticks instead of bursting to catch up
+                next_tick = time.monotonic()
+
+    def stop(self):
+        self.is_running = False
+
+
+class Coordinator(UdpServer):
+    """
+    UDP server of the --workers mode. It relays its share of the traffic like
+    any worker and owns the authoritative registry: every registration change
+    is pushed to the worker processes, which report back the players they
+    heard from and their counters. Reliable datagrams all end up here, the
+    stream of a player can't be split between processes.
+    """
+
+    def __init__(self, udp_port, lock, workers, metrics=None, idle_timeout=0, coalesce=0, limiter=None,
+                 legacy_timeout=0):
+        super().__init__(udp_port, lock, 0, metrics, idle_timeout, coalesce, limiter, reuse_port=True,
+                         legacy_timeout=legacy_timeout)
+        self.pipes = []
+        self.pipes_lock = Lock()
+        context = multiprocessing.get_context("spawn")
+        for index in range(1, workers):
+            pipe, child = context.Pipe()
+            context.Process(target=relay_worker, args=(index, udp_port, child, coalesce, limiter),
+                            daemon=True).start()
+            self.pipes.append(pipe)
+        self.collector = Thread(target=self.collect, daemon=True)
+        self.collector.start()
+
+    def broadcast(self, update):
+        with self.pipes_lock:
+            for pipe in self.pipes:
+                try:
+                    pipe.send(update)
+                except OSError:
+                    pass
+
+    def collect(self):
+        pipes = list(self.pipes)
+        while pipes:
+            for pipe in wait(pipes):
+                try:
+                    kind, *body = pipe.recv()
+                except (EOFError, OSError):
+                    pipes.remove(pipe)
+                    print("[UDP] A relay worker exited")
+                    continue
+                try:
+                    if kind == "reliable":
+                        # The worker's limiter already charged it
+                        relay(body[0], body[1], self.registry.snapshot, self.sendto, self.metrics, self.reliable)
+                    elif kind == "report":
+                        seen, counters = body
+                        for identifier in seen:
+                            self.touch(identifier)
+                        self.metrics.merge(counters)
+                except Exception as e:
+                    self.metrics.error("worker")
+                    print(f"[UDP] Worker message error: {e}")
+
+    def register_player(self, identifier, addr, wire=protocol.JSON, room=protocol.DEFAULT_ROOM, legacy=False):
+        player = super().register_player(identifier, addr, wire, room, legacy)
+        self.broadcast(("register", identifier, addr, player.session, wire, room))
+        return player
+
+    def unregister_player(self, identifier):
+        self.broadcast(("unregister", identifier))
+        return super().unregister_player(identifier)
+
+    def move_player(self, identifier, room):
+        self.broadcast(("move", identifier, room))
+        return super().move_player(identifier, room)
+
+
+class ReliableForwarder:
+
+    def __init__(self, pipe, lock):
+        """
+        Stands in for the ReliableHub of a relay worker: the reliable datagrams
+        that passed the sender, session and rate checks go to the coordinator,
+        which owns every stream, and nothing is delivered locally
+        """
+        self.pipe = pipe
+        self.lock = lock
+
+    def receive(self, player, data):
+        with self.lock:
+            self.pipe.send(("reliable", data, player.addr))
+        return []
+
+
+class RelayWorker(UdpServer):
+    """
+    Relay loop of a --workers process, its registry mirrors the coordinator's
+    """
+
+    REPORT = 1.0
+
+    def __init__(self, udp_port, pipe, metrics, coalesce=0, limiter=None):
+        super().__init__(udp_port, Lock(), 0, metrics, 0, coalesce, limiter, reuse_port=True)
+        self.pipe = pipe
+        self.pipe_lock = Lock()
+        self.reliable = ReliableForwarder(pipe, self.pipe_lock)
+        self.reported = time.monotonic()
+        self.totals = {}
+
+    def apply(self):
+        """
+        Mirror the coordinator's registrations until it goes away
+        """
+        while True:
+            try:
+                kind, identifier, *args = self.pipe.recv()
+            except (EOFError, OSError):
+                self.is_running = False
+                try:
+                    # Wakes up the recvfrom of the relay loop
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self.sock.close()
+                return
+            if kind == "register":
+                addr, session, wire, room = args
+                self.registry.register(Player(identifier, tuple(addr), session, wire, room))
+                self.metrics.player_joined(identifier, room)
+            elif kind == "unregister":
+                self.unregister_player(identifier)
+            elif kind == "move":
+                self.move_player(identifier, args[0])
+
+    def report(self):
+        """
+        Players heard from since the last report, and the counters' increments
+        """
+        now = time.monotonic()
+        seen = [player.identifier for player in self.registry if player.last_seen >= self.reported]
+        self.reported = now
+        totals = self.metrics.totals()
+        counters = Metrics.difference(totals, self.totals)
+        self.totals = totals
+        with self.pipe_lock:
+            self.pipe.send(("report", seen, counters))
+
+    def chores(self):
+        chores = [(self.REPORT, self.report, "REPORT")]
+        if self.outbox:
+            chores.append((self.coalesce, self.outbox.flush, "FLUSH"))
+        return chores
+
+
+def relay_worker(index, udp_port, pipe, coalesce, limiter):
+    """
+    Entry point of the extra relay processes of the --workers mode
+    """
+    metrics = Metrics()
+    worker = RelayWorker(udp_port, pipe, metrics, coalesce, limiter)
+    for interval, work, tag in worker.chores():
+        Periodic(interval, work, metrics, tag).start()
+    Thread(target=worker.apply, daemon=True).start()
+    print(f"[UDP] Relay worker {index} started")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
 class TcpServer(Thread):
-    def __init__(self, tcp_port, udp_server, lock):
+    def __init__(self, tcp_port, udp_server):
         super().__init__()
         self.tcp_port = tcp_port
-        self.lock = lock
         self.udp_server = udp_server
-        self.players = {}
+        # Registrations go straight to the UDP server's registry, the only one
+        self.registry = udp_server.registry
+        self.metrics = udp_server.metrics
+        self.idle_timeout = udp_server.idle_timeout
+        self.legacy_timeout = udp_server.legacy_timeout
         self.is_running = True
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.bind(("", tcp_port))
@@ -63,68 +670,334 @@ class TcpServer(Thread):
         while self.is_running:
             try:
                 conn, addr = self.sock.accept()
-                Thread(target=self.handle_client, args=(conn, addr)).start()
+                Thread(target=self.handle_client, args=(conn, addr), daemon=True).start()
             except Exception as e:
                 if self.is_running:
+                    self.metrics.error("tcp_accept")
                     print(f"[TCP] Accept error: {e}")
 
     def handle_client(self, conn, addr):
+        control = ControlConnection(self, addr)
         try:
-            data = conn.recv(1024).decode()
-            message = json.loads(data)
-            action = message.get("action")
-            payload = message.get("payload")
-            if action == "register":
-                udp_port = int(payload)
-                identifier = f"{addr[0]}:{udp_port}"
-                player = Player(identifier, (addr[0], udp_port))
-                with self.lock:
-                    self.players[identifier] = player
-                    self.udp_server.register_player(identifier, (addr[0], udp_port))
-                response = json.dumps({"success": True, "identifier": identifier})
-                conn.send(response.encode())
-                print(f"[TCP] Registered player {identifier}")
-            else:
-                response = json.dumps({"success": False, "message": "Unknown action"})
-                conn.send(response.encode())
+            data = conn.recv(65536)
+            while data:
+                response = control.receive(data)
+                if response:
+                    conn.sendall(response)
+                if control.done:
+                    break
+                data = conn.recv(65536)
         except Exception as e:
+            self.metrics.error("tcp_client")
             print(f"[TCP] Client error: {e}")
         finally:
+            control.close()
             conn.close()
 
+    def register_player(self, identifier, addr, wire=protocol.JSON, room=protocol.DEFAULT_ROOM, legacy=False):
+        return self.udp_server.register_player(identifier, addr, wire, room, legacy)
+
+    def unregister_player(self, identifier):
+        return self.udp_server.unregister_player(identifier)
+
+    def move_player(self, identifier, room):
+        return self.udp_server.move_player(identifier, room)
+
+    def touch(self, identifier):
+        self.udp_server.touch(identifier)
+
     def stop(self):
         self.is_running = False
+        try:
+            # Wakes up the accept of the listening thread
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
         print("[TCP] Server stopped")
 
 
-def main_loop(tcp_port, udp_port):
-    lock = Lock()
-    udp_server = UdpServer(udp_port, lock)
-    tcp_server = TcpServer(tcp_port, udp_server, lock)
+def metrics_response(metrics):
+    body = metrics.render().encode()
+    return (b"HTTP/1.0 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
 
-    udp_server.start()
-    tcp_server.start()
 
+class MetricsServer(Thread):
+    """
+    Prometheus-style text page of the server metrics, one request per connection
+    """
+
+    def __init__(self, port, metrics):
+        super().__init__(daemon=True)
+        self.port = port
+        self.metrics = metrics
+        self.is_running = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("", port))
+        self.sock.listen(5)
+
+    def run(self):
+        print(f"[METRICS] Serving on port {self.port}")
+        while self.is_running:
+            try:
+                conn, addr = self.sock.accept()
+                with conn:
+                    conn.settimeout(1)
+                    conn.recv(1024)
+                    conn.sendall(metrics_response(self.metrics))
+            except Exception as e:
+                if self.is_running:
+                    print(f"[METRICS] Error: {e}")
+
+    def stop(self):
+        self.is_running = False
+        self.sock.close()
+
+
+class AsyncUdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.server.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.server.relay(data, addr)
+
+    def error_received(self, exc):
+        self.server.metrics.error("udp")
+        print(f"[UDP] Error: {exc}")
+
+
+class AsyncServer(PlayerSessions):
+    """
+    Event-loop engine: registration and relay share a single asyncio loop,
+    no thread is created per socket or per connection
+    """
+
+    def __init__(self, tcp_port, udp_port, tick_rate=0, metrics_port=0, idle_timeout=0, coalesce=0,
+                 limiter=None, recorder=None, legacy_timeout=0):
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.metrics_port = metrics_port
+        metrics = Metrics()
+        self.setup(metrics, TimedLock(Lock(), metrics), tick_rate, idle_timeout, coalesce, limiter, recorder,
+                   legacy_timeout)
+        self.outbox = None
+        self.sendto = None
+        self.transport = None
+        self.tcp_server = None
+        self.stopped = None
+
+    def relay(self, data, addr):
+        if self.recorder:
+            self.recorder.datagram(data, addr)
+        try:
+            if self.sync is None or not self.sync.receive(data, addr):
+                relay(data, addr, self.registry.snapshot, self.sendto, self.metrics, self.reliable, self.limiter)
+        except Exception as e:
+            self.metrics.error("udp")
+            print(f"[UDP] Error: {e}")
+
+    async def ticker(self):
+        print(f"[TICK] State sync at {1 / self.sync.interval:g} Hz")
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.sync.interval
+            try:
+                self.sync.tick(self.sendto)
+                if self.outbox:
+                    self.outbox.flush()
+            except Exception as e:
+                self.metrics.error("tick")
+                print(f"[TICK] Error: {e}")
+            delay = next_tick - loop.time()
+            if delay < 0:
+                next_tick = loop.time()
+            await asyncio.sleep(max(0, delay))
+
+    async def periodic(self, interval, work, tag):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                work()
+            except Exception as e:
+                self.metrics.error(tag.lower())
+                print(f"[{tag}] Error: {e}")
+
+    async def handle_client(self, reader, writer):
+        control = ControlConnection(self, writer.get_extra_info("peername"))
+        try:
+            data = await reader.read(65536)
+            while data:
+                response = control.receive(data)
+                if response:
+                    writer.write(response)
+                    await writer.drain()
+                if control.done:
+                    break
+                data = await reader.read(65536)
+        except Exception as e:
+            self.metrics.error("tcp_client")
+            print(f"[TCP] Client error: {e}")
+        finally:
+            control.close()
+            writer.close()
+
+    async def handle_metrics(self, reader, writer):
+        try:
+            await reader.read(1024)
+            writer.write(metrics_response(self.metrics))
+            await writer.drain()
+        except Exception as e:
+            print(f"[METRICS] Error: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        await loop.create_datagram_endpoint(
+            lambda: AsyncUdpProtocol(self), local_addr=("0.0.0.0", self.udp_port))
+        self.outbox = Outbox(self.transport.sendto, self.metrics) if self.coalesce else None
+        self.sendto = self.outbox.sendto if self.outbox else self.transport.sendto
+        self.tcp_server = await asyncio.start_server(
+            self.handle_client, port=self.tcp_port, backlog=1024)
+        print(f"[UDP] Server listening on port {self.udp_port}")
+        print(f"[TCP] Server listening on port {self.tcp_port}")
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = await asyncio.start_server(self.handle_metrics, port=self.metrics_port)
+            print(f"[METRICS] Serving on port {self.metrics_port}")
+        ticker = asyncio.create_task(self.ticker()) if self.sync else None
+        chores = [asyncio.create_task(self.periodic(*chore)) for chore in self.chores()]
+        try:
+            await self.stopped.wait()
+        finally:
+            if ticker:
+                ticker.cancel()
+            for chore in chores:
+                chore.cancel()
+            if metrics_server:
+                metrics_server.close()
+            self.tcp_server.close()
+            await self.tcp_server.wait_closed()
+            self.transport.close()
+            print("[UDP] Server stopped")
+            print("[TCP] Server stopped")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def print_banner():
     print("--------------------------------------")
     print(" Simple Game Server Started.")
     print(" Press Ctrl+C to stop.")
     print("--------------------------------------")
 
+
+def main_loop(tcp_port, udp_port, engine="thread", tick_rate=0, metrics_port=0, idle_timeout=0, coalesce=0,
+              limiter=None, record=None, workers=1, legacy_timeout=0):
+    recorder = Recorder(record) if record else None
+    if recorder:
+        recorder.start()
+        print(f"[RECORD] Recording traffic to {record}")
+
+    if engine == "asyncio":
+        server = AsyncServer(tcp_port, udp_port, tick_rate, metrics_port, idle_timeout, coalesce, limiter, recorder,
+                             legacy_timeout)
+        print_banner()
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            print("\n[Main] Servers stopped.")
+        finally:
+            if recorder:
+                recorder.stop()
+        return
+
+    metrics = Metrics()
+    lock = TimedLock(Lock(), metrics)
+    if workers > 1:
+        udp_server = Coordinator(udp_port, lock, workers, metrics, idle_timeout, coalesce, limiter, legacy_timeout)
+        print(f"[UDP] {workers} relay processes share port {udp_port}")
+    else:
+        udp_server = UdpServer(udp_port, lock, tick_rate, metrics, idle_timeout, coalesce, limiter, recorder,
+                               legacy_timeout=legacy_timeout)
+    tcp_server = TcpServer(tcp_port, udp_server)
+    ticker = Ticker(udp_server.sync, udp_server.sendto, metrics, udp_server.outbox) if udp_server.sync else None
+    chores = [Periodic(interval, work, metrics, tag) for interval, work, tag in udp_server.chores()]
+    metrics_server = MetricsServer(metrics_port, metrics) if metrics_port else None
+
+    udp_server.start()
+    tcp_server.start()
+    if ticker:
+        ticker.start()
+    for chore in chores:
+        chore.start()
+    if metrics_server:
+        metrics_server.start()
+
+    print_banner()
+
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n[Main] Shutting down servers...")
+        if ticker:
+            ticker.stop()
+            ticker.join()
+        for chore in chores:
+            chore.stop()
+        if metrics_server:
+            metrics_server.stop()
         udp_server.stop()
         tcp_server.stop()
         udp_server.join()
         tcp_server.join()
+        if recorder:
+            recorder.stop()
         print("[Main] Servers stopped.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Game Server")
     parser.add_argument("--tcp", type=int, default=12345, help="TCP port")
     parser.add_argument("--udp", type=int, default=54321, help="UDP port")
+    parser.add_argument("--engine", choices=["thread", "asyncio"], default="thread",
+                        help="Server engine: one thread per socket/connection, or a single asyncio loop")
+    parser.add_argument("--tick-rate", type=float, default=0,
+                        help="Serve per-room state at this many ticks per second instead of only relaying (0: off)")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus-style metrics over HTTP on this port (0: off)")
+    parser.add_argument("--idle-timeout", type=float, default=30,
+                        help="Evict players silent on UDP and TCP for this many seconds (0: never)")
+    parser.add_argument("--legacy-timeout", type=float, default=600,
+                        help="Evict legacy one-shot registrations, which can't send heartbeats, after this "
+                             "many seconds of UDP silence (0: never)")
+    parser.add_argument("--coalesce", type=float, default=0,
+                        help="Batch binary datagrams per player and flush them every this many seconds "
+                             "and every tick (0: send immediately)")
+    parser.add_argument("--rate-limit", type=parse_limit, default=UNLIMITED, metavar="PACKETS:BYTES",
+                        help="Per-player relay limit in packets and bytes per second (0: unlimited)")
+    parser.add_argument("--room-limit", type=parse_room_limit, action="append", default=[],
+                        metavar="ROOM=PACKETS:BYTES", help="Rate limit of one room, overrides --rate-limit")
+    parser.add_argument("--block-seconds", type=float, default=10,
+                        help="Block players who keep flooding past their limit this long (0: never)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="Append every received datagram and registration to a traffic log (see replay.py)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Relay processes sharing the UDP port with SO_REUSEPORT (thread engine)")
     args = parser.parse_args()
-    main_loop(args.tcp, args.udp)
+    if args.workers > 1 and (args.engine != "thread" or args.tick_rate or args.record):
+        parser.error("--workers needs the thread engine, without --tick-rate or --record")
+    limiter = None
+    if args.rate_limit != UNLIMITED or args.room_limit:
+        limiter = RateLimiter(args.rate_limit, dict(args.room_limit), block=args.block_seconds)
+    main_loop(args.tcp, args.udp, args.engine, args.tick_rate, args.metrics_port, args.idle_timeout,
+              args.coalesce, limiter, args.record, args.workers, args.legacy_timeout)
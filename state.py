@@ -0,0 +1,155 @@
+import json
+import time
+from threading import Lock
+import protocol
+
+
+def parse(data):
+    """
+    Decode an input or ack datagram into (message type, value), None for anything else
+    """
+    if protocol.is_binary(data):
+        if len(data) < 2 or data[1] not in (protocol.MSG_INPUT, protocol.MSG_ACK):
+            return None
+        packet = protocol.decode(data)
+        if packet.type == protocol.MSG_ACK:
+            return protocol.MSG_ACK, packet.seq
+        return protocol.MSG_INPUT, json.loads(packet.payload.decode())
+    # Cheap filter so relayed JSON chatter isn't parsed twice
+    if b'"input"' not in data and b'"ack"' not in data:
+        return None
+    message = json.loads(data.decode())
+    if "input" in message:
+        return protocol.MSG_INPUT, message["input"]
+    if "ack" in message:
+        return protocol.MSG_ACK, int(message["ack"])
+    return None
+
+
+class RoomState:
+
+    def __init__(self):
+        """
+        Authoritative key/value state of a room, every key remembers the
+        tick it last changed at. A None value is a deletion.
+        """
+        self.values = {}
+        self.changed = {}
+
+    def apply(self, player, changes, tick):
+        """
+        Apply a player input, last write wins. Override for game rules.
+        """
+        for key, value in changes.items():
+            self.values[key] = value
+            self.changed[key] = tick
+
+    def delta(self, base):
+        """
+        Changes since tick base, the full state when base is 0
+        """
+        if base == 0:
+            return {key: value for key, value in self.values.items() if value is not None}
+        return {key: self.values[key] for key, tick in self.changed.items() if tick > base}
+
+    def compact(self, acked):
+        """
+        Forget deletions every member has acknowledged
+        """
+        for key in [k for k, tick in self.changed.items() if tick <= acked and self.values[k] is None]:
+            del self.values[key]
+            del self.changed[key]
+
+
+class StateSync:
+
+    def __init__(self, registry, rate=20, room_factory=RoomState):
+        """
+        Fixed-tick state synchronisation: inputs are applied as they arrive,
+        every tick each player gets one datagram with the changes since the
+        last tick it acknowledged (the full state right after joining)
+        """
+        self.registry = registry
+        self.interval = 1.0 / rate
+        self.room_factory = room_factory
+        self.rooms = {}
+        self.acked = {}
+        self.current = 0
+        self.lock = Lock()
+
+    def reset(self, identifier):
+        """
+        Send the full state to a player on the next tick (join, rejoin, room change)
+        """
+        with self.lock:
+            self.acked.pop(identifier, None)
+
+    def receive(self, data, addr):
+        """
+        Handle an input or ack datagram, returns False if it is neither
+        """
+        message = parse(data)
+        if message is None:
+            return False
+        player = self.registry.at(addr)
+        if player is None or (protocol.is_binary(data) and protocol.session_of(data) != player.session):
+            return True
+        player.last_seen = time.monotonic()
+        msg_type, value = message
+        with self.lock:
+            if msg_type == protocol.MSG_ACK:
+                if value <= self.current and value > self.acked.get(player.identifier, 0):
+                    self.acked[player.identifier] = value
+            elif isinstance(value, dict):
+                room = self.rooms.get(player.room)
+                if room is None:
+                    room = self.rooms[player.room] = self.room_factory()
+                room.apply(player, value, self.current + 1)
+        return True
+
+    def tick(self, sendto):
+        """
+        Advance one tick and send every player its delta
+        """
+        outbound = []
+        with self.lock:
+            self.current += 1
+            tick = self.current
+            players = self.registry.snapshot.players
+            if len(self.acked) > len(players):
+                self.acked = {pid: t for pid, t in self.acked.items() if pid in players}
+
+            members = {}
+            for player in players.values():
+                members.setdefault(player.room, []).append(player)
+
+            for room_id, room_players in members.items():
+                room = self.rooms.get(room_id)
+                if room is None:
+                    room = self.rooms[room_id] = self.room_factory()
+                # Players usually acknowledged the same tick, encode each delta once
+                encoded = {}
+                for player in room_players:
+                    base = self.acked.get(player.identifier, 0)
+                    key = (base, player.wire)
+                    if key not in encoded:
+                        encoded[key] = self.encode(room, base, tick, player.wire)
+                    if encoded[key] is not None:
+                        outbound.append((encoded[key], player.addr))
+                room.compact(min(self.acked.get(p.identifier, 0) for p in room_players))
+
+            for room_id in [r for r in self.rooms if r not in members]:
+                del self.rooms[room_id]
+
+        for data, addr in outbound:
+            sendto(data, addr)
+        return len(outbound)
+
+    def encode(self, room, base, tick, wire):
+        delta = room.delta(base)
+        if not delta and base != 0:
+            return None
+        if wire == protocol.BINARY:
+            payload = json.dumps({"base": base, "state": delta}, separators=(",", ":")).encode()
+            return protocol.encode(protocol.MSG_STATE, 0, tick, payload)
+        return json.dumps({"tick": tick, "base": base, "state": delta}).encode()
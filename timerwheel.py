@@ -0,0 +1,64 @@
+import time
+from threading import Lock
+
+
+class TimerWheel:
+
+    def __init__(self, resolution=1.0, slots=256):
+        """
+        Hashed timer wheel: a key lands in the slot of its deadline tick,
+        scheduling, rescheduling and cancelling are O(1) and advancing only
+        visits the slots of the elapsed ticks. Deadlines further away than
+        one rotation simply wait in their slot for the right lap.
+        """
+        self.resolution = resolution
+        self.slots = [{} for _ in range(slots)]
+        self.where = {}
+        self.current = self.tick_of(time.monotonic())
+        self.lock = Lock()
+
+    def tick_of(self, when):
+        return int(when / self.resolution)
+
+    def schedule(self, key, delay, now=None):
+        """
+        (Re)arm the timer of key to fire after delay seconds
+        """
+        now = time.monotonic() if now is None else now
+        # Never schedule into a tick advance() already visited
+        deadline = max(self.tick_of(now + delay), self.current + 1)
+        with self.lock:
+            previous = self.where.pop(key, None)
+            if previous is not None:
+                self.slots[previous % len(self.slots)].pop(key, None)
+            self.slots[deadline % len(self.slots)][key] = deadline
+            self.where[key] = deadline
+
+    def cancel(self, key):
+        with self.lock:
+            deadline = self.where.pop(key, None)
+            if deadline is not None:
+                self.slots[deadline % len(self.slots)].pop(key, None)
+
+    def advance(self, now=None):
+        """
+        Move the wheel to now, returns the keys whose timer fired
+        """
+        now = time.monotonic() if now is None else now
+        target = self.tick_of(now)
+        expired = []
+        with self.lock:
+            # A long stall only needs one pass over the wheel
+            first = max(self.current + 1, target - len(self.slots) + 1)
+            for tick in range(first, target + 1):
+                slot = self.slots[tick % len(self.slots)]
+                due = [key for key, deadline in slot.items() if deadline <= target]
+                for key in due:
+                    del slot[key]
+                    del self.where[key]
+                expired.extend(due)
+            self.current = max(self.current, target)
+        return expired
+
+    def __len__(self):
+        return len(self.where)